@@ -22,9 +22,13 @@
 
 
 import argparse
+from collections import deque
 from collections.abc import Callable
+from concurrent import futures
 import copy
 from datetime import datetime
+import hashlib
+import heapq
 import json
 import math
 import numpy as np
@@ -34,14 +38,13 @@ import os
 from pathlib import Path
 import platform
 import re
-from scipy import fftpack, interpolate, signal, stats
 import shutil
 import subprocess
+import threading
 import time
+from types import CodeType, ModuleType, SimpleNamespace
 from typing import Optional
 import traceback
-import vapoursynth as vs
-from vapoursynth import core
 
 if platform.system() == "Windows":
     os.system("")
@@ -55,6 +58,140 @@ class NumpyEncoder(json.JSONEncoder):
         else:
             return super(NumpyEncoder, self).default(object)
 
+# A class attribute that's only evaluated the first time it's accessed.
+# The result is cached separately for each zone it's accessed from, so
+# a zone that overrides what the function depends on gets its own value
+# instead of the one evaluated first.
+class Lazy:
+    def __init__(self, function):
+        self.function = function
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        if self.name not in instance.__dict__:
+            instance.__dict__[self.name] = self.function(instance)
+        return instance.__dict__[self.name]
+
+# A scenes JSON file in the temporary directory that's updated one scene
+# at a time. Instead of rewriting the whole file after every scene, the
+# updated scene is appended to a journal next to the file. The journal
+# is replayed when the file is loaded, and folded back into the file
+# every `compact_every` scenes. A partially written line at the end of
+# the journal, from the script being interrupted, is ignored.
+class SceneJournal:
+    def __init__(self, file, compact_every=256):
+        self.file = file
+        self.journal_file = file.with_name(file.name + ".journal")
+        self.compact_every = compact_every
+        self.journal_f = None
+        self.appended = 0
+
+    def load(self):
+        with self.file.open("r") as f:
+            data = json.load(f)
+        if self.journal_file.exists():
+            with self.journal_file.open("r") as journal_f:
+                for line in journal_f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+                    data["scenes"][entry["scene"]] = entry["data"]
+            self.save(data)
+        return data
+
+    def save(self, data):
+        temp_file = self.file.with_name(self.file.name + ".tmp")
+        with temp_file.open("w") as f:
+            json.dump(data, f, cls=NumpyEncoder)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.file)
+
+        if self.journal_f is not None:
+            self.journal_f.close()
+            self.journal_f = None
+        self.journal_file.unlink(missing_ok=True)
+        self.appended = 0
+
+    def update(self, data, scene_n):
+        if self.appended >= self.compact_every:
+            self.save(data)
+            return
+
+        if self.journal_f is None:
+            self.journal_f = self.journal_file.open("a")
+        self.journal_f.write(json.dumps({"scene": scene_n, "data": data["scenes"][scene_n]}, cls=NumpyEncoder) + "\n")
+        self.journal_f.flush()
+        self.appended += 1
+
+# A hash of a function from the config, used to tell whether cached
+# results are still valid. A function is keyed by its bytecode including
+# nested functions, its default arguments, the contents of its closure,
+# and the globals it refers to. Objects without a meaningful `repr` are
+# keyed by their type only, since their default `repr` changes every
+# run.
+def function_cache_value_key(value, seen):
+    if isinstance(value, vs.Function) or hasattr(value, "__code__"):
+        return function_cache_key(value, seen)
+    if isinstance(value, ModuleType):
+        return value.__name__
+    if isinstance(value, vs.Core):
+        return "vapoursynth.core"
+    if isinstance(value, (tuple, list)):
+        return repr([function_cache_value_key(item, seen) for item in value])
+    if isinstance(value, dict):
+        return repr({key: function_cache_value_key(item, seen) for key, item in value.items()})
+    if type(value).__repr__ is object.__repr__:
+        return type(value).__qualname__
+    return repr(value)
+
+def function_cache_code_key(code):
+    key = [code.co_code, repr(code.co_names).encode()]
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            key.append(function_cache_code_key(const))
+        else:
+            key.append(repr(const).encode())
+    return b"\n".join(key)
+
+def function_cache_code_names(code):
+    names = list(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names += function_cache_code_names(const)
+    return names
+
+def function_cache_key(function, seen=None):
+    if isinstance(function, vs.Function):
+        return f"{function.plugin.namespace}.{function.name}"
+    function = getattr(function, "__func__", function)
+    if not hasattr(function, "__code__"):
+        return repr(function)
+
+    if seen is None:
+        seen = set()
+    if id(function) in seen:
+        return function.__qualname__
+    seen.add(id(function))
+
+    key = [function_cache_code_key(function.__code__),
+           function_cache_value_key(function.__defaults__, seen).encode(),
+           function_cache_value_key(function.__kwdefaults__, seen).encode()]
+    for cell in function.__closure__ or ():
+        try:
+            key.append(function_cache_value_key(cell.cell_contents, seen).encode())
+        except ValueError:
+            key.append(b"")
+    for name in sorted(set(function_cache_code_names(function.__code__))):
+        if name in function.__globals__:
+            key.append(f"{name}={function_cache_value_key(function.__globals__[name], seen)}".encode())
+    return hashlib.blake2b(b"\n".join(key), digest_size=16).hexdigest()
+
 parser = argparse.ArgumentParser(prog="Progression Boost", epilog="For more configs, open `Progression-Boost.py` in a text editor and follow the guide at the very top")
 parser.add_argument("-i", "--input", type=Path, required=True, help="Source video file")
 parser.add_argument("--encode-input", type=Path, help="Source file for test encodes. Supports both video file and vpy file (Default: same as `--input`). This file is only used to perform probe encodes, while all other processes will be performed using the video file specified in `--input`. Note that if you apply filtering for test encodes, you probably also want to apply the same filtering before metric calculation, which can be set via `metric_reference` in the `Progression-Boost.py` file itself")
@@ -70,6 +207,7 @@ group.add_argument("--zones-string", help="Zones string for Progression Boost. S
 parser.add_argument("--temp", type=Path, help="Temporary folder for Progression Boost (Default: output scenes file with file extension replaced by „.boost.tmp“)")
 parser.add_argument("-r", "--resume", action="store_true", help="Resume from the temporary folder. By enabling this option, Progression Boost will reuse finished or unfinished testing encodes. This should be disabled should the parameters for test encode be changed")
 parser.add_argument("-v", "--verbose", action="count", default=0, help="Report more details of Progression Boost. This parameter can be specified up to 3 times")
+parser.add_argument("--character-benchmark", nargs="?", type=int, const=240, help="Benchmark the Character Boost inference settings against full resolution inference on the specified number of frames (Default: 240), and exit")
 args = parser.parse_args()
 input_file = args.input
 probing_input_file = args.encode_input
@@ -98,10 +236,14 @@ for dir_ in [scene_detection_temp_dir, progression_boost_temp_dir, character_boo
     dir_.mkdir(parents=True, exist_ok=True)
 resume = args.resume
 verbose = args.verbose
+character_benchmark = args.character_benchmark
 
 if not resume:
     temp_dir.joinpath("source.ffindex").unlink(missing_ok=True)
 
+import vapoursynth as vs
+from vapoursynth import core
+
 
 # ---------------------------------------------------------------------
 # ---------------------------------------------------------------------
@@ -205,7 +347,7 @@ class DefaultZone:
 # ---------------------------------------------------------------------
 # How should this script load your source video? Select the video
 # provider for both this Python script and for av1an.
-    source_clip = core.ffms2.Source(input_file.expanduser().resolve(), cachefile=temp_dir.joinpath("source.ffindex").expanduser().resolve())
+    source_clip_provider = lambda self: core.ffms2.Source(input_file.expanduser().resolve(), cachefile=temp_dir.joinpath("source.ffindex").expanduser().resolve())
     source_clip_cache = temp_dir.joinpath("source.ffindex")
     source_provider = lambda self, file: core.ffms2.Source(file.expanduser().resolve(), cachefile=file.with_suffix(".ffindex").expanduser().resolve())
     source_provider_cache = lambda self, file: file.with_suffix(".ffindex")
@@ -214,39 +356,40 @@ class DefaultZone:
 # BestSource for source, and then use faster ffms2 to read Progression
 # Boost's probe encodes. To use this option, comment the lines above
 # and uncomment the lines below.
-    # source_clip = core.bs.VideoSource(input_file.expanduser().resolve())
+    # source_clip_provider = lambda self: core.bs.VideoSource(input_file.expanduser().resolve())
     # source_clip_cache = None
     # source_provider = lambda self, file: core.ffms2.Source(file.expanduser().resolve(), cachefile=file.with_suffix(".ffindex").expanduser().resolve())
     # source_provider_cache = lambda self, file: file.with_suffix(".ffindex")
     # source_provider_av1an = "bestsource"
 # If you want to use all BestSource instead, comment the lines above
 # and uncomment the lines below.
-    # source_clip = core.bs.VideoSource(input_file.expanduser().resolve())
+    # source_clip_provider = lambda self: core.bs.VideoSource(input_file.expanduser().resolve())
     # source_clip_cache = None
     # source_provider = core.bs.VideoSource
     # source_provider_cache = lambda self, file: None
     # source_provider_av1an = "bestsource"
 # If you want to use lsmas instead, comment the lines above and
 # uncomment the lines below.
-    # source_clip = core.lsmas.LWLibavSource(input_file.expanduser().resolve(), cachefile=temp_dir.joinpath("source.lwi").expanduser().resolve())
+    # source_clip_provider = lambda self: core.lsmas.LWLibavSource(input_file.expanduser().resolve(), cachefile=temp_dir.joinpath("source.lwi").expanduser().resolve())
     # source_clip_cache = temp_dir.joinpath("source.lwi")
     # source_provider = lambda self, file: core.lsmas.LWLibavSource(file.expanduser().resolve(), cachefile=file.with_suffix(".lwi").expanduser().resolve())
     # source_provider_cache = lambda self, file: file.with_suffix(".lwi")
     # source_provider_av1an = "lsmash"
 # Also, it's possible to only use BestSource for source, and then use
 # faster lsmas to read Progression Boost's probe encodes.
-    # source_clip = core.bs.VideoSource(input_file.expanduser().resolve())
+    # source_clip_provider = lambda self: core.bs.VideoSource(input_file.expanduser().resolve())
     # source_clip_cache = None
     # source_provider = lambda self, file: core.lsmas.LWLibavSource(file.expanduser().resolve(), cachefile=file.with_suffix(".lwi").expanduser().resolve())
     # source_provider_cache = lambda self, file: file.with_suffix(".lwi")
     # source_provider_av1an = "bestsource"
 
-# This `source_clip` above is used in all three modules of Progression
-# Boost. Let's say if your source has 5 seconds of intro LOGO, and you
-# want to cut it away, this is what you need to do:
-# First, for all the processes within Progression Boost, uncomment the
-# lines below:
-    # source_clip = source_clip[120:]
+# This `source_clip_provider` above is used in all three modules of
+# Progression Boost. Let's say if your source has 5 seconds of intro
+# LOGO, and you want to cut it away, this is what you need to do:
+# First, for all the processes within Progression Boost, append the
+# trim to the end of the `source_clip_provider` you're using, like the
+# line below:
+    # source_clip_provider = lambda self: core.ffms2.Source(input_file.expanduser().resolve(), cachefile=temp_dir.joinpath("source.ffindex").expanduser().resolve())[120:]
 # And then, for av1an, you should create a VapourSynth file like this
 # and feed it through Progression Boost's `--encode-input` and
 # `--scene-detection-input` commandline option:
@@ -307,6 +450,14 @@ class DefaultZone:
 #   b) search for `metric_reference` in the script, and apply the same
 #      filtering to `metric_reference`.
 
+# You don't need to modify the line below. `source_clip` is the source
+# opened by `source_clip_provider`, which is only opened the first time
+# it's used. Progression Boost calls `source_clip_provider` again
+# whenever it needs additional instances of the source for decoding
+# different parts of it in parallel. All zones share the same instance
+# opened for the default zone.
+    source_clip = Lazy(lambda self: self.source_clip_provider() if self is zone_default else zone_default.source_clip)
+
 # To optimise for speed, Progression Boost copies `source_clip_cache`
 # into the av1an temp folder for scene detection and probing. This
 # will cause issues if:
@@ -319,9 +470,9 @@ class DefaultZone:
 # `False`, or switch to lsmas or BestSource.
     source_clip_cache_reuse = True
 
-# Zoning information: `source_clip` and `source_provider` are not
-# zoneable, but you can write VapourSynth code to `core.std.Splice` it
-# yourself. Make sure you do the same for `--encode-input`,
+# Zoning information: `source_clip_provider` and `source_provider` are
+# not zoneable, but you can write VapourSynth code to `core.std.Splice`
+# it yourself. Make sure you do the same for `--encode-input`,
 # `--scene-detection-input`, and final encode as well.
 # `source_clip_cache_reuse` is not zoneable.
 # ---------------------------------------------------------------------
@@ -418,8 +569,17 @@ class DefaultZone:
 
 # `--resume` information: If you've modified anything scene detection
 # related, you need to delete everything in `scene-detection` folder in
-# the temporary directory except for the four .txt files starting with
-# `luma-`, and then you can rerun the script.
+# the temporary directory except for `luma.npy`, `detection.npy` and
+# `detection.json`, and then you can rerun the script. The results of
+# WWXD, Scxvid and x264 are cached in `detection.npy`, and the zones and
+# settings they're produced with, including a hash of
+# `source_clip_provider`, are recorded in `detection.json`. They are
+# only reused if they still match.
+# `scene_detection_x264_workers` and `scene_detection_decode_workers`
+# are not part of these settings, so changing only them keeps the
+# cached results.
+# An x264 based scene detection that was interrupted before finishing
+# is always started over from the beginning.
 
 # Zoning information: all three `scene_detection_method` is zoneable,
 # which means you can mix av1an based scene detection with VapourSynth
@@ -472,15 +632,60 @@ class DefaultZone:
 # `scene_detection_extra_split` and `scene_detection_min_scene_len`
 # above will make a difference.
 
-# `--resume` information: If you've modified anything scene detection
-# related, you need to delete everything in `scene-detection` folder in
-# the temporary directory except for the four .txt files starting with
-# `luma-`, and then you can rerun the script.
+# `--resume` information: If you've only modified the settings in this
+# section, you only need to delete `scenes.json` in `scene-detection`
+# folder in the temporary directory, and then you can rerun the script.
+# WWXD, Scxvid and x264 will not be rerun.
 
 # Zoning information: `scene_detection_extra_split` and
 # `scene_detection_min_scene_len` are only zoneable if you use
 # VapourSynth based scene detection.
 # ---------------------------------------------------------------------
+# Progression Boost measures the luminance of every frame and runs the
+# VapourSynth based scene detection in a single pass over the source.
+# This pass is limited by how fast a single instance of the source
+# filter can decode. Progression Boost opens this many instances of the
+# source via `source_clip_provider`, each decoding a different part of
+# the source, and processes them in parallel. Set this to `1` if you're
+# short on memory.
+# Scxvid needs to see every frame of a zone in order, so this is
+# ignored if any zone uses `"wwxd_scxvid"`.
+    scene_detection_decode_workers = max(1, min(8, (os.cpu_count() or 1) // 8))
+
+# Zoning information: `scene_detection_decode_workers` is not zoneable.
+# ---------------------------------------------------------------------
+# By default, x264 based scene detection is performed via av1an, which
+# decodes the whole source a second time in parallel to the VapourSynth
+# pass above. If decoding the source is expensive, you can let
+# Progression Boost feed the frames it already decodes for WWXD to x264
+# through pipes instead. Note that x264 then sees the downscaled 8 bit
+# frames WWXD sees instead of the full source, and will make slightly
+# different decisions.
+# x264 is cut at the boundaries of the parts decoded in parallel, so
+# `scene_detection_decode_workers` also sets the number of x264
+# segments per zone. Each segment is started once its first frame is
+# decoded, and `scene_detection_x264_workers` below limits how many of
+# them run at the same time.
+# This requires a YUV source. Sources that are not YUV 4:2:0 are
+# converted to 4:2:0 before they are sent to x264.
+    scene_detection_x264_pipe = False
+
+# Zoning information: `scene_detection_x264_pipe` is not zoneable.
+# ---------------------------------------------------------------------
+# When x264 based scene detection is performed via av1an, each zone is
+# cut into this many segments, each detected by its own x264 process
+# running in parallel. Neighbouring segments overlap by a few frames so
+# that x264 sees some frames past the end of each segment, and the
+# results are then stitched back together.
+# If `scene_detection_x264_pipe` is enabled, this is instead the number
+# of x264 processes allowed to run at the same time. Segments that are
+# still being fed frames are never waited for, so up to
+# `scene_detection_decode_workers` x264 processes may still run at the
+# same time if this is set lower.
+    scene_detection_x264_workers = max(2, min(16, (os.cpu_count() or 1) // 4))
+
+# Zoning information: `scene_detection_x264_workers` is not zoneable.
+# ---------------------------------------------------------------------
 # ---------------------------------------------------------------------
 
 
@@ -769,18 +974,43 @@ class DefaultZone:
 # ---------------------------------------------------------------------
 # At last, av1an parameters:
 
+# Every scene is probed on its own, and each scene moves on from first
+# probe to second probe as soon as metric for its first probe is
+# calculated, without waiting for other scenes.
+# The number of probe encodes running at the same time is set here
+# instead of via av1an's `--workers`. The fastest `--lp`
+# `probing_workers` combination is listed below:
+#   32 threads: --lp 3, probing_workers = 8
+#   24 threads: --lp 3, probing_workers = 6
+#   16 threads: --lp 3, probing_workers = 4
+#   12 threads: --lp 3, probing_workers = 3
+    probing_workers = 8
+
+# By default, Progression Boost runs SvtAv1EncApp directly for every
+# probe encode and feeds it the frames itself. The probe encodes are
+# kept as separate IVF files that are opened directly for metric
+# calculation.
+# If `--encode-input` is a `.vpy` file, it is fed to SvtAv1EncApp via
+# vspipe, and it should output 10 bit YUV 4:2:0. Otherwise, the source
+# is opened inside Progression Boost and converted to 10 bit, same as
+# `--pix-format yuv420p10le` in av1an.
+# `probing_av1an_parameters` is not used if this is enabled, and
+# `probing_dynamic_encoder` must return `"svt_av1"`.
+#
+# If you need av1an for probe encodes, for example to use an encoder
+# other than `"svt_av1"`, disable this. An av1an process with
+# `--workers 1` is then launched for every probe encode. This is slower,
+# as av1an sets up its temporary directory, the index and vspipe for
+# every single scene. Don't set `--workers` in
+# `probing_av1an_parameters`. Use `probing_workers` above instead.
+    probing_native = True
+
 # These are the av1an parameters for probe encodes.
-# The only thing you would need to adjust here is `--workers`. The
-# fastest `--lp` `--workers` combination is listed below:
-#   32 threads: --lp 3 --workers 8
-#   24 threads: --lp 3 --workers 6
-#   16 threads: --lp 3 --workers 4
-#   12 threads: --lp 3 --workers 3
     def probing_av1an_parameters(self, message: str) -> list[str]:
-        return (f"--workers 8 --pix-format yuv420p10le"
+        return (f"--pix-format yuv420p10le"
 # Below are the parameters that should always be used. Regular users
 # would not need to modify these.
-              + f" --chunk-method {self.source_provider_av1an} --chunk-order random --encoder svt-av1 --audio-params -an --concat mkvmerge --force --video-params").split() + \
+              + f" --chunk-method {self.source_provider_av1an} --chunk-order random --encoder svt-av1 --audio-params -an --concat ivf --force --video-params").split() + \
                 [message]
 
 # These are the photon noise parameters for your final encode. These
@@ -823,7 +1053,8 @@ class DefaultZone:
 # need to delete anything in temporary directory, and the changes will
 # be updated once you rerun the script.
 
-# Zoning information: `probing_av1an_parameters` is not zoneable.
+# Zoning information: `probing_workers`, `probing_native` and
+# `probing_av1an_parameters` are not zoneable.
 # ---------------------------------------------------------------------
 # ---------------------------------------------------------------------
 # Once the test encodes finish, Progression Boost will start
@@ -873,6 +1104,26 @@ class DefaultZone:
 # to be safer, you should measure more frames in such as
 # `metric_highest_diff_frames`.
     metric_highest_probing_diff_frames = 8
+# The raw difference can also be calculated on a downscaled luma plane
+# to make it faster, which is slightly less precise. Set this to 2 or 4
+# to compare at half or a quarter of the width and height. The
+# downscaled comparison is performed before `metric_process`, and only
+# the frames finally selected are later processed at full resolution
+# for metric calculation.
+    metric_highest_probing_diff_downscale = 1
+# By default, frames from this method are picked before the randomiser
+# below, so that the randomiser keeps its separation from them. If you
+# set this to `True`, they are picked after the randomiser instead. This
+# changes which frames are selected, but in exchange, when
+# `metric_highest_probing_diff_downscale` is 1 and `metric_method` is
+# VapourSynth based, the reference and probe frames decoded here are
+# kept and reused for metric calculation instead of decoding the probe
+# encode a second time.
+# With the default `False`, the frames selected are the same as in
+# earlier versions, and the probe encode is still decoded once here and
+# once more for metric calculation. Only when this is set to `True`
+# will the probe encode be decoded once.
+    metric_highest_probing_diff_after_brackets = False
 #
 # After that, we now use a randomiser to select frames across the whole
 # scene. This is the primary method of selecting frames in the old
@@ -929,8 +1180,9 @@ class DefaultZone:
 #
 # For VapourSynth based metric calculation, if you've applied filtering
 # via `--encode-input`, make sure you match it and apply the same
-# filtering here:
-    metric_reference = source_clip.resize.Bicubic(filter_param_a=0.0, filter_param_b=0.0, format=vs.YUV420P10)
+# filtering here. `Lazy` makes sure the source is only opened when
+# metric is actually calculated:
+    metric_reference = Lazy(lambda self: self.source_clip.resize.Bicubic(filter_param_a=0.0, filter_param_b=0.0, format=vs.YUV420P10))
 #
 # For VapourSynth based metric calculation, this function allows you to
 # perform some additional filtering on both `metric_reference` above
@@ -949,6 +1201,13 @@ class DefaultZone:
 # If you want some other processing before calculating metrics, you can
 # implement it here.
         return clip
+#
+# For VapourSynth based metric calculation, frames from all the scenes
+# whose probe encodes have finished are requested in one continuous
+# stream instead of scene by scene. This sets how many frames can be
+# requested ahead. GPU based metrics such as vship may need a higher
+# number to be kept busy. This is only read from the default zone.
+    metric_vapoursynth_prefetch = 48
         
 # FFVship is only available if you've not applied filtering via
 # `--encode-input`, and you don't plan to apply additional filtering
@@ -965,6 +1224,16 @@ class DefaultZone:
 # related options will be available in the next section of the guide.
     metric_ffvship_extra_parameters = []
 #
+# FFVship is run once for every probe encode of every scene. It can
+# only compare one encoded file per run, and every scene is probed into
+# its own file, so the runs can't be batched per probing round. Each run
+# loads the index of the source again from the cached index file,
+# instead of indexing the source again. These runs happen in the
+# background while Progression Boost moves on to other scenes, and this
+# sets how many of them can run at the same time.
+# This is only read from the default zone.
+    metric_ffvship_workers = 2
+#
 # To avoid accidentally selecting the FFVship option when providing
 # additional filtering, Progression Boost will refuse to run when
 # `--encode-input` is provided. However, you can force it to continue
@@ -972,6 +1241,12 @@ class DefaultZone:
     metric_continue_filtered_with_ffvship = False
 # ---------------------------------------------------------------------
 # What metric do you want to use?
+#
+# Note that `metric_vapoursynth_metric` is applied on the frame props
+# cached in `metric-cache` folder, not on the actual frame. Only
+# `frame.props` is available, and only props holding a single number
+# are cached. If you need anything else from the frame, compute it into
+# such a frame prop inside `metric_vapoursynth_calculate` instead.
 
 # To use Butteraugli 3Norm via FFVship or vship, uncomment the lines
 # below.
@@ -1048,12 +1323,24 @@ class DefaultZone:
     # metric_vapoursynth_metric = lambda self, frame: frame.props["SSIMULACRA2"]
 
 # `--resume` information: If you changed to a different metric or
-# metric measurement, you need to delete `probe-encode-first.mkv` in
+# metric measurement, you need to delete `result.json` in
 # `progression-boost` folder inside the temporary directory. By doing
-# this, you won't reencode the first probe encode, but you will
-# reencode the second probe encode due to internal machanics of
-# Progression Boost. After deleting `probe-encode-first.mkv`, you can
-# rerun the script.
+# this, you won't reencode any of the probe encodes unless the new
+# metric picks a different qstep for the second probe encode. If you
+# only changed `metric_vapoursynth_metric` or `metric_ffvship_metric`
+# to read a different value from the same metric, the raw results
+# cached in `metric-cache` folder are reused and no frame will be
+# measured again. After deleting `result.json`, you can rerun the
+# script.
+# ---------------------------------------------------------------------
+# The raw results cached in `metric-cache` folder are discarded when
+# `metric_vapoursynth_calculate` or `metric_process` changes, including
+# their default arguments, the variables they capture and the global
+# functions and variables they use. Some changes can't be detected this
+# way, such as other settings of the zone read inside `metric_process`,
+# or an update to the metric plugin itself. In these cases, change this
+# string to anything different to discard the cached results.
+    metric_cache_version = ""
 # ---------------------------------------------------------------------
 # After calcuating metric for frames, we summarise the quality for each
 # scene into a single value. There are two main ways for this in new
@@ -1099,6 +1386,8 @@ class DefaultZone:
 # is no longer recommended, we still want to take this chance and thank
 # Miss Moonlight for her various contributions to boosting.
     # def metric_summarise(self, frames: np.ndarray[np.int32], scores: np.ndarray[np.float32]) -> np.float32:
+    #     from scipy import interpolate, stats
+    #
     #     if verbose >= 3:
     #         print(f"\r\033[K{scene_frame_print(scene_n)} / Metric summarisation", end="", flush=True)
     #
@@ -1148,11 +1437,12 @@ class DefaultZone:
     #     pass
 
 # `--resume` information: If you changed `metric_summarise`, you need
-# to delete `probe-encode-first.mkv` in `progression-boost` folder
-# inside the temporary directory. By doing this, you won't reencode the
-# first probe encode, but you will reencode the second probe encode due
-# to internal machanics of Progression Boost. After deleting
-# `probe-encode-first.mkv`, you can rerun the script.
+# to delete `result.json` in `progression-boost` folder inside the
+# temporary directory. By doing this, the scenes are summarised again
+# from the raw results cached in `metric-cache` folder, and you won't
+# reencode any of the probe encodes unless the new summarisation picks
+# a different qstep for the second probe encode. After deleting
+# `result.json`, you can rerun the script.
 # ---------------------------------------------------------------------
 # After calculating the percentile, or harmonic mean, or other           # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
 # quantizer of the data, we fit the quantizers to a polynomial model     # <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
@@ -1181,9 +1471,9 @@ class DefaultZone:
 # need to delete anything in the temp folder for this change to update.
 # However, if you adjusted `metric_target` too much, such as from
 # Butteraugli 1.100 all the way to 0.700 or from SSIMU2 88.000 to
-# 80.000, you may need to delete `probe-encode-second.tmp`,
-# `probe-encode-second.mkv` and `probe-encode-second.scenes.json` in
-# the `progression-boost` folder inside the temporary directory.
+# 80.000, you may need to delete `result.json` in the
+# `progression-boost` folder inside the temporary directory. Only the
+# second probe encodes whose qstep has changed will be reencoded.
 # ---------------------------------------------------------------------
 # ---------------------------------------------------------------------
 
@@ -1300,10 +1590,70 @@ class DefaultZone:
         import vsmlrt
         model = Path(vsmlrt.models_path) / "anime-segmentation" / "isnet_is.onnx"
         if not model.exists():
-            raise FileNotFoundError(f"Could not find anime-segmentation model at \"{character_model}\". Acquire it from https://github.com/AmusementClub/vs-mlrt/releases/external-models")
+            raise FileNotFoundError(f"Could not find anime-segmentation model at \"{model}\". Acquire it from https://github.com/AmusementClub/vs-mlrt/releases/external-models")
         return model
 # Zoning information: `character_get_model` is not zoneable.
 # ---------------------------------------------------------------------
+# By default, the segmentation model is run at the full resolution of
+# the source, only for the result to be reduced to one value per 64x64
+# block afterwards. For sources larger than 1080p, or if you're using a
+# CPU based backend, you can run the model at a lower resolution by
+# setting the long side of the frame for inference below, such as
+# `1280` or `1024`. `None` means full resolution. Sources smaller than
+# this are not upscaled.
+    character_inference_resolution = None
+
+# For very large frames, the model can also be run in tiles. Set the
+# number of tiles on each side of the frame below, and the overlap in
+# pixels between tiles, which must be a multiple of 16. The overlap is
+# cropped off after inference so that the edges of tiles don't show up
+# in the map. All tiles are run one after another through a single
+# instance of the model.
+    character_inference_tiles = 1
+    character_inference_tile_overlap = 64
+
+# You can check how much faster these settings are, and how closely
+# their maps agree with full resolution inference, by running
+# Progression Boost with `--character-benchmark`. Every run is also
+# appended to `character-benchmark.jsonl` in the temporary directory,
+# together with the settings and the backend it was run with, so that
+# results from different settings can be compared later.
+#
+# `--resume` information: If you changed the inference resolution or
+# tiles, you need to delete `kyara.json` in `characters-boost` folder
+# inside the temporary directory, and rerun the script.
+# Zoning information: `character_inference_resolution`,
+# `character_inference_tiles` and `character_inference_tile_overlap`
+# are not zoneable.
+# ---------------------------------------------------------------------
+# Character Boost runs the segmentation model on every 4th, 8th, 16th
+# or 32nd frame of a scene depending on how much the scene moves.
+# Anime has a lot of holds and animation on twos or threes, where these
+# frames are the same as the last frame the model was run on.
+# Set a threshold below to only run the model on a frame if the sum of
+# LumaDiff since the last frame the model was run on is above it.
+# Otherwise, the map of the last frame is reused, and the frame is
+# recorded as propagated in `kyara.json`. There is no recommended value
+# for this yet. The number of frames propagated is printed once
+# character segmentation finishes, and you should compare the maps in
+# `kyara.json` with and without propagation before relying on a value.
+# `None` disables propagation.
+    character_propagation_threshold = None
+
+# `--resume` information: If you changed
+# `character_propagation_threshold`, you need to delete `kyara.json` in
+# `characters-boost` folder inside the temporary directory, and rerun
+# the script.
+# ---------------------------------------------------------------------
+# Character segmentation runs in the background alongside the probe
+# encodes and metric calculation, as one stream over the frames of all
+# scenes. Set how many frames can be requested ahead of the frame
+# currently being collected.
+# This only needs to be large enough to keep vs-mlrt's streams busy at
+# all times. Raising it only costs memory.
+    character_prefetch = 48
+# Zoning information: `character_prefetch` is not zoneable.
+# ---------------------------------------------------------------------
 # ---------------------------------------------------------------------
 
 
@@ -1439,22 +1789,33 @@ if zones_string is not None:
 else:
     zones_list = []
 
+# When resuming, the number of frames is read from the temporary
+# directory so that the source doesn't need to be opened just for
+# validating the zones.
+if resume and scene_detection_temp_dir.joinpath("scenes.json").exists():
+    with scene_detection_temp_dir.joinpath("scenes.json").open("r") as scenes_f:
+        source_num_frames = json.load(scenes_f)["frames"]
+elif resume and scene_detection_temp_dir.joinpath("luma.npy").exists():
+    source_num_frames = np.load(scene_detection_temp_dir.joinpath("luma.npy"), mmap_mode="r").shape[1]
+else:
+    source_num_frames = zone_default.source_clip.num_frames
+
 zones = []
 frame_head = 0
 for item in zones_list:
     if item[0] < frame_head:
         raise ValueError(f"Repeating section [{item[0]}:{frame_head}] between input zones.")
-    if item[0] > zone_default.source_clip.num_frames - 1:
+    if item[0] > source_num_frames - 1:
         print(f"\r\033[KSkipping zones with out of bound start_frame {item[0]}...", end="\n", flush=True)
 
     if item[1] <= -2:
         raise ValueError(f"Invalid end_frame in the zones with value {item[1]}")
-    if item[1] > zone_default.source_clip.num_frames:
-        print(f"\r\033[K\033[31mOut of bound end_frame {item[1]} in one of the zones provided. Clamp end_frame for the zone to {zone_default.source_clip.num_frames}...\033[0m", end="\n", flush=True)
+    if item[1] > source_num_frames:
+        print(f"\r\033[K\033[31mOut of bound end_frame {item[1]} in one of the zones provided. Clamp end_frame for the zone to {source_num_frames}...\033[0m", end="\n", flush=True)
         print(f"\r\033[KUse `-1` as end_frame to always end the zone at the last frame of the video.", end="\n", flush=True)
-        item[1] = zone_default.source_clip.num_frames
+        item[1] = source_num_frames
     if item[1] == -1:
-        item[1] = zone_default.source_clip.num_frames
+        item[1] = source_num_frames
         
     if item[1] <= item[0]:
         raise ValueError(f"Invalid zone with start_frame {item[0]} and end_frame {item[1]}.")
@@ -1473,9 +1834,9 @@ for item in zones_list:
                   "zone": zones_spec[item[2]]})
     frame_head = item[1]
 
-if frame_head != zone_default.source_clip.num_frames:
+if frame_head != source_num_frames:
     zones.append({"start_frame": frame_head,
-                  "end_frame": zone_default.source_clip.num_frames,
+                  "end_frame": source_num_frames,
                   "zone": zones_spec["default"]})
     
 for zone in zones:
@@ -1507,12 +1868,6 @@ for zone in zones:
 
         break
 
-for zone in zones:
-    if zone["zone"].character_enable:
-        character_backend = zone_default.character_get_backend()
-        character_model = zone_default.character_get_model()
-
-        break
 for zone in zones:
     if zone["zone"].character_enable and zone["zone"].character_roi_boost_max:
         if not roi_maps_dir:
@@ -1522,6 +1877,19 @@ for zone in zones:
 
         break
 
+# The backend and the model are resolved here so that a missing model is
+# reported before scene detection. The segmentation itself is only set
+# up once Character Boost actually runs.
+for zone in zones:
+    if zone["zone"].character_enable:
+        assert zone_default.character_inference_resolution is None or zone_default.character_inference_resolution > 0, "Invalid `character_inference_resolution`. Please check your config inside `Progression-Boost.py`."
+        assert zone_default.character_inference_tiles >= 1 and zone_default.character_inference_tile_overlap >= 0 and zone_default.character_inference_tile_overlap % 16 == 0, "Invalid `character_inference_tiles` or `character_inference_tile_overlap`. Please check your config inside `Progression-Boost.py`."
+        assert zone_default.character_prefetch >= 1, "Invalid `character_prefetch`. Please check your config inside `Progression-Boost.py`."
+        character_backend = zone_default.character_get_backend()
+        character_model = zone_default.character_get_model()
+
+        break
+
 
 # ---------------------------------------------------------------------
 # ---------------------------------------------------------------------
@@ -1567,24 +1935,56 @@ scene_detection_x264_temp_dir = scene_detection_temp_dir.joinpath("x264.tmp")
 scene_detection_x264_output_file = scene_detection_temp_dir.joinpath("x264.mkv")
 scene_detection_x264_stats_dir = scene_detection_temp_dir.joinpath("x264.logs")
 scene_detection_av1an_scenes_file = scene_detection_temp_dir.joinpath("av1an.scenes.json")
+# `luma.npy` is a float32 array of shape `(4, num_frames)` holding the
+# LumaDiff, LumaAverage, LumaMin and LumaMax of every frame. It's filled
+# under a temporary name and only renamed into place once complete, and
+# it's memory mapped instead of parsed when resuming.
+scene_detection_luma_file = scene_detection_temp_dir.joinpath("luma.npy")
+scene_detection_luma_temp_file = scene_detection_temp_dir.joinpath("luma.tmp.npy")
+# `detection.npy` is a bool array of shape `(3, num_frames)` holding the
+# raw per frame results of WWXD, Scxvid and x264, before they're fused
+# with `luma.npy`. `detection.json` records what they're produced from.
+scene_detection_detection_file = scene_detection_temp_dir.joinpath("detection.npy")
+scene_detection_detection_temp_file = scene_detection_temp_dir.joinpath("detection.tmp.npy")
+scene_detection_detection_key_file = scene_detection_temp_dir.joinpath("detection.json")
+# Text files written by older versions of Progression Boost
 scene_detection_diffs_file = scene_detection_temp_dir.joinpath("luma-diff.txt")
 scene_detection_average_file = scene_detection_temp_dir.joinpath("luma-average.txt")
 scene_detection_min_file = scene_detection_temp_dir.joinpath("luma-min.txt")
 scene_detection_max_file = scene_detection_temp_dir.joinpath("luma-max.txt")
 
+def scene_detection_create_luma(num_frames):
+    return np.lib.format.open_memmap(scene_detection_luma_temp_file, mode="w+", dtype=np.float32, shape=(4, num_frames))
+
+def scene_detection_load_luma():
+    scene_detection_luma = np.load(scene_detection_luma_file, mmap_mode="r")
+    assert scene_detection_luma.ndim == 2 and scene_detection_luma.shape[0] == 4, f"Invalid `{scene_detection_luma_file}`. Please delete the file and rerun the script."
+    return scene_detection_luma
+
 scene_detection_diffs_available = False
-if resume and scene_detection_diffs_file.exists() and \
-              scene_detection_average_file.exists() and \
-              scene_detection_min_file.exists() and \
-              scene_detection_max_file.exists():
-    scene_detection_diffs = np.loadtxt(scene_detection_diffs_file, dtype=np.float32)
-    scene_detection_average = np.loadtxt(scene_detection_average_file, dtype=np.float32)
-    scene_detection_min = np.loadtxt(scene_detection_min_file, dtype=np.float32)
-    scene_detection_max = np.loadtxt(scene_detection_max_file, dtype=np.float32)
-    scene_detection_diffs_available = True
-
-
-frame_rjust_digits = math.floor(np.log10(zone_default.source_clip.num_frames)) + 1
+if resume:
+    if not scene_detection_luma_file.exists() and \
+       scene_detection_diffs_file.exists() and \
+       scene_detection_average_file.exists() and \
+       scene_detection_min_file.exists() and \
+       scene_detection_max_file.exists():
+        scene_detection_luma = np.stack([np.loadtxt(scene_detection_diffs_file, dtype=np.float32),
+                                         np.loadtxt(scene_detection_average_file, dtype=np.float32),
+                                         np.loadtxt(scene_detection_min_file, dtype=np.float32),
+                                         np.loadtxt(scene_detection_max_file, dtype=np.float32)])
+        with scene_detection_luma_temp_file.open("wb") as scene_detection_luma_f:
+            np.save(scene_detection_luma_f, scene_detection_luma)
+        scene_detection_luma_temp_file.replace(scene_detection_luma_file)
+        for file in [scene_detection_diffs_file, scene_detection_average_file, scene_detection_min_file, scene_detection_max_file]:
+            file.unlink()
+
+    if scene_detection_luma_file.exists():
+        scene_detection_luma = scene_detection_load_luma()
+        scene_detection_diffs, scene_detection_average, scene_detection_min, scene_detection_max = scene_detection_luma
+        scene_detection_diffs_available = True
+
+
+frame_rjust_digits = math.floor(np.log10(source_num_frames)) + 1
 frame_print = lambda frame: f"Frame {frame}"
 frame_rjust = lambda frame: str(frame).rjust(frame_rjust_digits)
 frame_scene_print = lambda start_frame, end_frame: f"Scene [{frame_rjust(start_frame)}:{frame_rjust(end_frame)}]"
@@ -1593,16 +1993,16 @@ frame_scene_print = lambda start_frame, end_frame: f"Scene [{frame_rjust(start_f
 if not resume or not scene_detection_scenes_file.exists():
     for zone in zones:
         if zone["zone"].scene_detection_method == "x264_vapoursynth":
-            scene_detection_perform_x264 = True
+            scene_detection_has_x264 = True
             break
     else:
-        scene_detection_perform_x264 = False
+        scene_detection_has_x264 = False
     for zone in zones:
         if zone["zone"].scene_detection_method in ["x264_vapoursynth", "vapoursynth"]:
-            scene_detection_perform_vapoursynth = True
+            scene_detection_has_vapoursynth = True
             break
     else:
-        scene_detection_perform_vapoursynth = False
+        scene_detection_has_vapoursynth = False
     for zone in zones:
         if zone["zone"].scene_detection_method == "av1an":
             if not resume or not scene_detection_av1an_scenes_file.exists():
@@ -1622,48 +2022,202 @@ if not resume or not scene_detection_scenes_file.exists():
     else:
         scene_detection_has_external = False
 
+    # These are checked even if both `luma.npy` and `detection.npy` are
+    # reused, since the settings are still used to create scenes.
+    for zone in zones:
+        assert zone["zone"].scene_detection_method in ["av1an", "x264_vapoursynth", "vapoursynth", "external"], "Invalid `scene_detection_method`. Please check your config inside `Progression-Boost.py`."
+
+        if zone["zone"].scene_detection_method in ["x264_vapoursynth", "vapoursynth"]:
+            assert zone["zone"].scene_detection_vapoursynth_method in ["wwxd", "wwxd_scxvid"], "Invalid `scene_detection_vapoursynth_method`. Please check your config inside `Progression-Boost.py`."
+            assert zone["zone"].scene_detection_vapoursynth_range in ["limited", "full"], "Invalid `scene_detection_vapoursynth_range`. Please check your config inside `Progression-Boost.py`."
+            assert zone["zone"].scene_detection_extra_split >= zone["zone"].scene_detection_min_scene_len * 2, "`scene_detection_method` `vapoursynth` does not support `scene_detection_extra_split` to be smaller than 2 times `scene_detection_min_scene_len`."
+
+    scene_detection_detection_key = {
+        "input": [str(input_file), input_file.stat().st_size, input_file.stat().st_mtime_ns],
+        "scene_detection_input": [str(scene_detection_input_file), scene_detection_input_file.stat().st_size, scene_detection_input_file.stat().st_mtime_ns, scene_detection_vspipe_args],
+        "frames": source_num_frames,
+        "zones": [[zone["start_frame"], zone["end_frame"], zone["zone"].scene_detection_method,
+                   zone["zone"].scene_detection_vapoursynth_method if zone["zone"].scene_detection_method in ["x264_vapoursynth", "vapoursynth"] else None] for zone in zones],
+        "x264_pipe": zone_default.scene_detection_x264_pipe if scene_detection_has_x264 else None,
+        "source_clip_provider": function_cache_key(zone_default.source_clip_provider)
+    }
+    scene_detection_detection_available = False
+    if resume and scene_detection_has_vapoursynth and \
+       scene_detection_detection_file.exists() and scene_detection_detection_key_file.exists():
+        with scene_detection_detection_key_file.open("r") as detection_key_f:
+            if json.load(detection_key_f) == json.loads(json.dumps(scene_detection_detection_key)):
+                scene_detection_detection = np.load(scene_detection_detection_file)
+                assert scene_detection_detection.shape == (3, source_num_frames), f"Invalid `{scene_detection_detection_file}`. Please delete the file and rerun the script."
+                scene_detection_wwxd, scene_detection_scxvid, scene_detection_x264 = scene_detection_detection
+
+                zones_x264_scenecut = {}
+                for zone_i, zone in enumerate(zones):
+                    if zone["zone"].scene_detection_method == "x264_vapoursynth":
+                        zones_x264_scenecut[zone_i] = np.array(scene_detection_x264[zone["start_frame"]:zone["end_frame"]], dtype=float)
+                scene_detection_detection_available = True
+    scene_detection_perform_x264 = scene_detection_has_x264 and not scene_detection_detection_available
+    if scene_detection_perform_x264 and zone_default.scene_detection_x264_pipe:
+        assert zone_default.source_clip.format.color_family == vs.YUV, "`scene_detection_x264_pipe` requires a YUV source. Please disable `scene_detection_x264_pipe` or check your config inside `Progression-Boost.py`."
+        assert zone_default.scene_detection_x264_workers >= 1, "Invalid `scene_detection_x264_workers`. Please check your config inside `Progression-Boost.py`."
+    scene_detection_bits = zone_default.source_clip.format.bits_per_sample
+    scene_detection_perform_vapoursynth = scene_detection_has_vapoursynth and not scene_detection_detection_available
+
 
     if scene_detection_perform_x264:
+        # Stats files and av1an chunks left from an earlier run may have
+        # been produced with different segments or settings, and are not
+        # reused whenever x264 based scene detection is run again.
         scene_detection_x264_output_file.unlink(missing_ok=True)
-        scene_detection_x264_stats_dir.mkdir(exist_ok=True)
+        shutil.rmtree(scene_detection_x264_stats_dir, ignore_errors=True)
+        shutil.rmtree(scene_detection_x264_temp_dir, ignore_errors=True)
+        scene_detection_x264_stats_dir.mkdir()
+
+        def scene_detection_x264_parameters(name, start_frame, end_frame):
+            return ["--output-depth", "10",
+                    "--preset", "veryfast",
+                    "--qp", "80",
+                    "--keyint", f"{end_frame - start_frame + 240}",
+                    "--min-keyint", "1",
+                    "--scenecut", "40",
+                    "--rc-lookahead", "120",
+                    "--ref", "1",
+                    "--aq-mode", "0",
+                    "--no-8x8dct",
+                    "--partition", "none",
+                    "--no-weightb",
+                    "--weightp", "0",
+                    "--me", "dia",
+                    "--subme", "2", # Required for scene detection
+                    "--no-psy",
+                    "--trellis", "0",
+                    "--no-cabac",
+                    "--no-deblock",
+                    "--slow-firstpass",
+                    "--pass", "1",
+                    "--stats", f"{scene_detection_x264_stats_dir / f"{name}.log"}"]
+
+        # Each zone is cut into segments that are each run through its own
+        # x264 first pass, stored as `(name, start_frame, end_frame)`.
+        # Segments of the same zone may overlap, in which case all but the
+        # first frame of the later segment are used.
+        scene_detection_x264_segments = {}
+        scene_detection_x264_total_frames_print = 0
+        for zone_i, zone in enumerate(zones):
+            if zone["zone"].scene_detection_method == "x264_vapoursynth":
+                scene_detection_x264_total_frames_print += zone["end_frame"] - zone["start_frame"]
+
+        # The stats files are read while x264 is still writing them, so that
+        # when zones are split after the VapourSynth based detection, each
+        # zone only waits for x264 to finish its own segments instead of
+        # the whole source. Fusing and splitting a zone while the
+        # VapourSynth based detection is still running is not implemented.
+        # Zones are only fused and split after the VapourSynth based
+        # detection of the whole source has finished, so this only helps
+        # when x264 is the slower of the two.
+        # x264 writes to `.log.temp` and renames it to `.log` once
+        # finished, which keeps the position we've read up to valid across
+        # the rename.
+        zones_x264_scenecut = {}
+        scene_detection_x264_stats = {}
+        scene_detection_match_x264_I = re.compile(rb"^in:(\d+) out:\d+ type:(\w)")
+        def scene_detection_read_x264_stats():
+            for zone_i, segments in scene_detection_x264_segments.items():
+                zone = zones[zone_i]
+                if zone_i not in zones_x264_scenecut:
+                    zones_x264_scenecut[zone_i] = np.zeros((zone["end_frame"] - zone["start_frame"],), dtype=float)
+                x264_scenecut = zones_x264_scenecut[zone_i]
+
+                for name, start_frame, end_frame in segments:
+                    if name not in scene_detection_x264_stats:
+                        scene_detection_x264_stats[name] = {"position": 0, "buffer": b"", "frames": 0}
+                    stats = scene_detection_x264_stats[name]
+                    if stats["frames"] == end_frame - start_frame:
+                        continue
+
+                    stats_file = scene_detection_x264_stats_dir / f"{name}.log"
+                    for stats_file in [stats_file, stats_file.with_name(f"{stats_file.name}.temp")]:
+                        try:
+                            with stats_file.open("rb") as stats_f:
+                                stats_f.seek(stats["position"])
+                                stats["buffer"] += stats_f.read()
+                                stats["position"] = stats_f.tell()
+                            break
+                        except FileNotFoundError:
+                            continue
+                    else:
+                        continue
+
+                    lines = stats["buffer"].split(b"\n")
+                    stats["buffer"] = lines.pop()
+                    for line in lines:
+                        if match := scene_detection_match_x264_I.match(line):
+                            offset_frame = int(match.group(1))
+                            assert offset_frame + start_frame < end_frame, "Unexpected result from av1an or x264"
+                            stats["frames"] += 1
+
+                            # Where segments overlap, a frame is a scenecut if
+                            # any of the segments decided so, except for the
+                            # first frame of every segment, which x264 always
+                            # forces to be an I frame.
+                            if offset_frame == 0 and start_frame != zone["start_frame"]:
+                                continue
+
+                            if match.group(2) == b"I":
+                                x264_scenecut[offset_frame + start_frame - zone["start_frame"]] = 1
+
+        def scene_detection_x264_covered(zone_i):
+            for name, start_frame, end_frame in scene_detection_x264_segments[zone_i]:
+                if name not in scene_detection_x264_stats or scene_detection_x264_stats[name]["frames"] != end_frame - start_frame:
+                    return False
+            return True
+
+        def scene_detection_x264_running():
+            if not zone_default.scene_detection_x264_pipe:
+                return scene_detection_x264_process.poll() is None
+            else:
+                for x264_process in scene_detection_x264_processes:
+                    if x264_process.poll() is None:
+                        return True
+                return False
+
+        def scene_detection_wait_x264(zone_i):
+            while True:
+                running = scene_detection_x264_running()
+                scene_detection_read_x264_stats()
+                if scene_detection_x264_covered(zone_i):
+                    return
+                assert running, "Unexpected result from av1an or x264"
+
+                print(f"\r\033[K{frame_print(zones[zone_i]["start_frame"])} / Waiting for x264 based scene detection", end="", flush=True)
+                time.sleep(0.2)
+
+    if scene_detection_perform_x264 and not zone_default.scene_detection_x264_pipe:
+        assert zone_default.scene_detection_x264_workers >= 1, "Invalid `scene_detection_x264_workers`. Please check your config inside `Progression-Boost.py`."
 
         scene_detection_x264_scenes = {}
         scene_detection_x264_scenes["scenes"] = []
         scene_detection_x264_total_frames = 0
-        scene_detection_x264_total_frames_print = 0
         for zone_i, zone in enumerate(zones):
             if zone["zone"].scene_detection_method == "x264_vapoursynth":
-                def scene_detection_append_x264_scene(name, start_frame, end_frame):
+                # Every segment except for the last one extends 4 frames into
+                # the next segment. Segments are at least 60 frames long.
+                scene_detection_x264_segments_count = min(zone_default.scene_detection_x264_workers, max(1, (zone["end_frame"] - zone["start_frame"]) // 60))
+                scene_detection_x264_boundaries = np.linspace(zone["start_frame"], zone["end_frame"], scene_detection_x264_segments_count + 1).astype(int).tolist()
+                scene_detection_x264_segments[zone_i] = []
+                for segment_i in range(scene_detection_x264_segments_count):
+                    scene_detection_x264_segments[zone_i].append((f"{zone_i}_{segment_i}",
+                                                                  scene_detection_x264_boundaries[segment_i],
+                                                                  min(scene_detection_x264_boundaries[segment_i + 1] + 4, zone["end_frame"])))
+
+                for name, start_frame, end_frame in scene_detection_x264_segments[zone_i]:
+                    scene_detection_x264_total_frames += end_frame - start_frame
                     scene_detection_x264_scenes["scenes"].append({
                         "start_frame": start_frame,
                         "end_frame": end_frame,
                         "zone_overrides": {
                             "encoder": "x264",
                             "passes": 1,
-                            "video_params": [
-                                "--output-depth", "10",
-                                "--preset", "veryfast",
-                                "--qp", "80",
-                                "--keyint", f"{end_frame - start_frame + 240}",
-                                "--min-keyint", "1",
-                                "--scenecut", "40",
-                                "--rc-lookahead", "120",
-                                "--ref", "1",
-                                "--aq-mode", "0",
-                                "--no-8x8dct",
-                                "--partition", "none",
-                                "--no-weightb",
-                                "--weightp", "0",
-                                "--me", "dia",
-                                "--subme", "2", # Required for scene detection
-                                "--no-psy",
-                                "--trellis", "0",
-                                "--no-cabac",
-                                "--no-deblock",
-                                "--slow-firstpass",
-                                "--pass", "1",
-                                "--stats", f"{scene_detection_x264_stats_dir / f"{name}.log"}"
-                            ],
+                            "video_params": scene_detection_x264_parameters(name, start_frame, end_frame),
                             "photon_noise": None,
                             "photon_noise_height": None,
                             "photon_noise_width": None,
@@ -1672,14 +2226,6 @@ if not resume or not scene_detection_scenes_file.exists():
                             "min_scene_len": zone["zone"].scene_detection_min_scene_len
                         }
                     })
-                scene_detection_x264_total_frames_print += zone["end_frame"] - zone["start_frame"]
-                if zone["end_frame"] - zone["start_frame"] < 120:
-                    scene_detection_x264_total_frames += zone["end_frame"] - zone["start_frame"]
-                    scene_detection_append_x264_scene(f"{zone_i}", zone["start_frame"], zone["end_frame"])
-                else:
-                    scene_detection_x264_total_frames += zone["end_frame"] - zone["start_frame"] + 4
-                    scene_detection_append_x264_scene(f"{zone_i}_left", zone["start_frame"], math.floor((zone["start_frame"] + zone["end_frame"]) / 2) + 4)
-                    scene_detection_append_x264_scene(f"{zone_i}_right", math.floor((zone["start_frame"] + zone["end_frame"]) / 2), zone["end_frame"])
         scene_detection_x264_scenes["frames"] = scene_detection_x264_total_frames
         scene_detection_x264_scenes["split_scenes"] = scene_detection_x264_scenes["scenes"]
 
@@ -1706,8 +2252,6 @@ if not resume or not scene_detection_scenes_file.exists():
             "--temp", scene_detection_x264_temp_dir,
             "--keep"
         ]
-        if resume:
-            command += ["--resume"]
         command += [
             "-i", scene_detection_input_file
         ]
@@ -1719,7 +2263,7 @@ if not resume or not scene_detection_scenes_file.exists():
             "--chunk-method", zone_default.source_provider_av1an,
             "--encoder", "x264",
             "--pix-format", "yuv420p10le",
-            "--workers", "2",
+            "--workers", f"{zone_default.scene_detection_x264_workers}",
             "--force", "--video-params", f"[K[0m[1;3m> Progression Boost [0m[3mx264-based-scene-detection[0m[1;3m <[0m",
             "--audio-params", "-an",
             "--concat", "mkvmerge"
@@ -1756,106 +2300,236 @@ if not resume or not scene_detection_scenes_file.exists():
         scene_detection_process = subprocess.Popen(command, text=True)
 
         
-    if not scene_detection_diffs_available:
-        if not (scene_detection_perform_vapoursynth and not scene_detection_has_av1an and not scene_detection_has_external):
-            scene_detection_luma_clip = zone_default.source_clip
-            scene_detection_luma_clip = scene_detection_luma_clip.std.PlaneStats(scene_detection_luma_clip[0] + scene_detection_luma_clip, plane=0, prop="Luma")
-            
-            start = time.time() - 0.000001
-            scene_detection_diffs = np.empty((scene_detection_luma_clip.num_frames,), dtype=np.float32)
-            scene_detection_average = np.empty((scene_detection_luma_clip.num_frames,), dtype=np.float32)
-            scene_detection_min = np.empty((scene_detection_luma_clip.num_frames,), dtype=np.float32)
-            scene_detection_max = np.empty((scene_detection_luma_clip.num_frames,), dtype=np.float32)
-            for current_frame, frame in enumerate(scene_detection_luma_clip.frames(backlog=48)):
-                print(f"\r\033[K{frame_print(current_frame)} / Measuring frame luminance / {current_frame / (time.time() - start):.2f} fps", end="\r", flush=True)
+    if not scene_detection_diffs_available or scene_detection_perform_vapoursynth:
+        assert zone_default.scene_detection_decode_workers >= 1, "Invalid `scene_detection_decode_workers`. Please check your config inside `Progression-Boost.py`."
+
+        # Frame luminance, WWXD and Scxvid are all measured from the same
+        # decode of the source. The source is cut into ranges, each decoded
+        # by its own instance of the source. Every range starts one frame
+        # early so that `LumaDiff` and WWXD of its first frame is measured
+        # against the actual previous frame. The ranges are then interleaved
+        # so that a single request stream keeps all instances decoding.
+        for zone in zones:
+            if zone["zone"].scene_detection_method in ["x264_vapoursynth", "vapoursynth"] and \
+               zone["zone"].scene_detection_vapoursynth_method == "wwxd_scxvid":
+                scene_detection_decode_workers = 1
+                break
+        else:
+            scene_detection_decode_workers = min(zone_default.scene_detection_decode_workers, source_num_frames)
+        scene_detection_decode_ranges = np.linspace(0, source_num_frames, scene_detection_decode_workers + 1).astype(int).tolist()
+        # When feeding x264 through pipes, each range instead starts 4
+        # frames early so that x264 segments of neighbouring ranges overlap.
+        if scene_detection_perform_x264 and zone_default.scene_detection_x264_pipe:
+            scene_detection_decode_heads = [max(scene_detection_decode_ranges[worker] - 4, 0) for worker in range(scene_detection_decode_workers)]
+        else:
+            scene_detection_decode_heads = [max(scene_detection_decode_ranges[worker] - 1, 0) for worker in range(scene_detection_decode_workers)]
+        scene_detection_decode_lengths = [scene_detection_decode_ranges[worker + 1] - scene_detection_decode_heads[worker] for worker in range(scene_detection_decode_workers)]
+
+        if not scene_detection_diffs_available:
+            scene_detection_luma = scene_detection_create_luma(source_num_frames)
+            scene_detection_diffs, scene_detection_average, scene_detection_min, scene_detection_max = scene_detection_luma
+
+        if scene_detection_perform_vapoursynth:
+            scene_detection_wwxd_frames = np.zeros((source_num_frames,), dtype=bool)
+            scene_detection_scxvid_frames = np.zeros((source_num_frames,), dtype=bool)
+            for zone in zones:
+                if zone["zone"].scene_detection_method in ["x264_vapoursynth", "vapoursynth"]:
+                    scene_detection_wwxd_frames[zone["start_frame"]:zone["end_frame"]] = True
+                    if zone["zone"].scene_detection_vapoursynth_method == "wwxd_scxvid":
+                        scene_detection_scxvid_frames[zone["start_frame"]:zone["end_frame"]] = True
+            scene_detection_wwxd = np.zeros((source_num_frames,), dtype=bool)
+            scene_detection_scxvid = np.zeros((source_num_frames,), dtype=bool)
+
+            target_width = np.round(np.sqrt(1280 * 720 / zone_default.source_clip.width / zone_default.source_clip.height) * zone_default.source_clip.width / 40) * 40
+            if target_width < zone_default.source_clip.width * 0.9:
+                target_height = np.ceil(target_width / zone_default.source_clip.width * zone_default.source_clip.height / 2) * 2
+                src_height = target_height / target_width * zone_default.source_clip.width
+                src_top = (zone_default.source_clip.height - src_height) / 2
+
+        scene_detection_clips = []
+        for worker in range(scene_detection_decode_workers):
+            if worker == 0:
+                scene_detection_clip_base = zone_default.source_clip
+            else:
+                scene_detection_clip_base = zone_default.source_clip_provider()
+            scene_detection_clip_head = scene_detection_decode_heads[worker]
+            scene_detection_clip_base = scene_detection_clip_base[scene_detection_clip_head:scene_detection_decode_ranges[worker + 1]]
+
+            if not scene_detection_diffs_available:
+                scene_detection_clip_base = scene_detection_clip_base.std.PlaneStats(scene_detection_clip_base[0] + scene_detection_clip_base, plane=0, prop="Luma")
+
+            if scene_detection_perform_x264 and zone_default.scene_detection_x264_pipe and \
+               (scene_detection_clip_base.format.subsampling_w != 1 or scene_detection_clip_base.format.subsampling_h != 1):
+                scene_detection_clip_base = scene_detection_clip_base.resize.Bicubic(format=scene_detection_clip_base.format.replace(subsampling_w=1, subsampling_h=1))
+
+            if scene_detection_perform_vapoursynth:
+                if target_width < zone_default.source_clip.width * 0.9:
+                    scene_detection_clip_base = scene_detection_clip_base.resize.Point(width=target_width, height=target_height, src_top=src_top, src_height=src_height,
+                                                                                       format=vs.YUV420P8, dither_type="none")
+
+                # WWXD and Scxvid are applied per zone so that each zone
+                # starts its detection fresh at the zone boundary.
+                scene_detection_clip_pieces = []
+                for zone in zones:
+                    piece_start = max(zone["start_frame"], scene_detection_clip_head)
+                    piece_end = min(zone["end_frame"], scene_detection_decode_ranges[worker + 1])
+                    if piece_start >= piece_end:
+                        continue
+
+                    scene_detection_clip = scene_detection_clip_base[piece_start - scene_detection_clip_head:piece_end - scene_detection_clip_head]
+                    if zone["zone"].scene_detection_method in ["x264_vapoursynth", "vapoursynth"]:
+                        scene_detection_clip = scene_detection_clip.wwxd.WWXD()
+                        if zone["zone"].scene_detection_vapoursynth_method == "wwxd_scxvid":
+                            scene_detection_clip = scene_detection_clip.scxvid.Scxvid()
+                    scene_detection_clip_pieces.append(scene_detection_clip)
+                scene_detection_clip_base = core.std.Splice(scene_detection_clip_pieces)
+
+            scene_detection_clips.append(scene_detection_clip_base)
+        scene_detection_clip = core.std.Interleave(scene_detection_clips, extend=True)
+
+        if scene_detection_perform_x264 and zone_default.scene_detection_x264_pipe:
+            assert scene_detection_clip.format.color_family == vs.YUV and \
+                   scene_detection_clip.format.subsampling_w == 1 and scene_detection_clip.format.subsampling_h == 1, "This indicates a bug in the original code. Please report this to the repository including this entire error message."
+            scene_detection_x264_command = ["x264",
+                                            "--demuxer", "raw",
+                                            "--input-csp", "i420",
+                                            "--input-depth", f"{scene_detection_clip.format.bits_per_sample}",
+                                            "--input-res", f"{scene_detection_clip.width}x{scene_detection_clip.height}"]
+            if zone_default.source_clip.fps.numerator > 0:
+                scene_detection_x264_command += ["--fps", f"{zone_default.source_clip.fps.numerator}/{zone_default.source_clip.fps.denominator}"]
+
+            # Every segment is fed by exactly one of the ranges, so that
+            # frames always arrive at x264 in order. The segments of each
+            # range are queued in order, and x264 is only started for a
+            # segment when its first frame arrives. Each range feeds at most
+            # one segment at a time.
+            scene_detection_x264_pipes = [deque() for worker in range(scene_detection_decode_workers)]
+            scene_detection_x264_feeding = [None for worker in range(scene_detection_decode_workers)]
+            scene_detection_x264_processes = []
+            for zone_i, zone in enumerate(zones):
+                if zone["zone"].scene_detection_method == "x264_vapoursynth":
+                    scene_detection_x264_segments[zone_i] = []
+                    for worker in range(scene_detection_decode_workers):
+                        start_frame = max(zone["start_frame"], scene_detection_decode_heads[worker])
+                        end_frame = min(zone["end_frame"], scene_detection_decode_ranges[worker + 1])
+                        if start_frame >= end_frame:
+                            continue
+
+                        name = f"{zone_i}_{len(scene_detection_x264_segments[zone_i])}"
+                        scene_detection_x264_segments[zone_i].append((name, start_frame, end_frame))
+                        command = scene_detection_x264_command + scene_detection_x264_parameters(name, start_frame, end_frame) + ["-o", os.devnull, "-"]
+                        scene_detection_x264_pipes[worker].append((start_frame, end_frame, command))
+
+            # Before starting another x264, wait for x264 processes that have
+            # already received all their frames until fewer than
+            # `scene_detection_x264_workers` are running.
+            def scene_detection_x264_launch(command):
+                while sum([x264_process.poll() is None for x264_process in scene_detection_x264_processes]) >= zone_default.scene_detection_x264_workers:
+                    for x264_process in scene_detection_x264_processes:
+                        if x264_process.poll() is None and x264_process.stdin.closed:
+                            x264_process.wait()
+                            break
+                    else:
+                        break
+                x264_process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                                stdout=None if verbose >= 3 else subprocess.DEVNULL,
+                                                stderr=None if verbose >= 3 else subprocess.DEVNULL)
+                scene_detection_x264_processes.append(x264_process)
+                return x264_process
+
+        start = time.time() - 0.000001
+        x264_read = start
+        last_print = 0
+        measured_frames = 0
+        for interleaved_frame, frame in enumerate(scene_detection_clip.frames(backlog=48)):
+            if scene_detection_perform_x264 and time.time() - x264_read >= 1.0:
+                scene_detection_read_x264_stats()
+                x264_read = time.time()
+
+            worker = interleaved_frame % scene_detection_decode_workers
+            if interleaved_frame // scene_detection_decode_workers >= scene_detection_decode_lengths[worker]:
+                continue
+            current_frame = scene_detection_decode_heads[worker] + interleaved_frame // scene_detection_decode_workers
+
+            if scene_detection_perform_x264 and zone_default.scene_detection_x264_pipe:
+                if scene_detection_x264_feeding[worker] is None and scene_detection_x264_pipes[worker] and scene_detection_x264_pipes[worker][0][0] == current_frame:
+                    _, x264_end_frame, command = scene_detection_x264_pipes[worker].popleft()
+                    scene_detection_x264_feeding[worker] = (x264_end_frame, scene_detection_x264_launch(command))
+                if scene_detection_x264_feeding[worker] is not None:
+                    x264_end_frame, x264_process = scene_detection_x264_feeding[worker]
+                    for plane in range(frame.format.num_planes):
+                        x264_process.stdin.write(np.asarray(frame[plane]).tobytes())
+                    if current_frame == x264_end_frame - 1:
+                        x264_process.stdin.close()
+                        scene_detection_x264_feeding[worker] = None
+
+            if current_frame < scene_detection_decode_ranges[worker]:
+                continue
+
+            if time.time() - last_print >= 0.25:
+                last_print = time.time()
+                if scene_detection_perform_vapoursynth:
+                    print(f"\r\033[K{frame_print(measured_frames)} / Detecting scenes / {measured_frames / (last_print - start):.2f} fps", end="", flush=True)
+                else:
+                    print(f"\r\033[K{frame_print(measured_frames)} / Measuring frame luminance / {measured_frames / (last_print - start):.2f} fps", end="", flush=True)
+
+            if not scene_detection_diffs_available:
                 scene_detection_diffs[current_frame] = frame.props["LumaDiff"]
                 scene_detection_average[current_frame] = frame.props["LumaAverage"]
                 scene_detection_min[current_frame] = frame.props["LumaMin"]
                 scene_detection_max[current_frame] = frame.props["LumaMax"]
-            print(f"\r\033[K{frame_print(current_frame + 1)} / Frame luminance measurement complete / {(current_frame + 1) / (time.time() - start):.2f} fps", end="\n", flush=True)
-            
-            np.savetxt(scene_detection_diffs_file, scene_detection_diffs, fmt="%.9f")
-            np.savetxt(scene_detection_average_file, scene_detection_average, fmt="%.9f")
-            np.savetxt(scene_detection_min_file, scene_detection_min, fmt="%.9f")
-            np.savetxt(scene_detection_max_file, scene_detection_max, fmt="%.9f")
-            scene_detection_diffs_available = True
-
-    
-    if scene_detection_perform_vapoursynth:
-        if not scene_detection_diffs_available:
-            scene_detection_diffs = np.empty((zone_default.source_clip.num_frames,), dtype=np.float32)
-            scene_detection_average = np.empty((zone_default.source_clip.num_frames,), dtype=np.float32)
-            scene_detection_min = np.empty((zone_default.source_clip.num_frames,), dtype=np.float32)
-            scene_detection_max = np.empty((zone_default.source_clip.num_frames,), dtype=np.float32)
-
-        scene_detection_clip_base = zone_default.source_clip
-        scene_detection_bits = scene_detection_clip_base.format.bits_per_sample
+            if scene_detection_perform_vapoursynth:
+                if scene_detection_wwxd_frames[current_frame]:
+                    scene_detection_wwxd[current_frame] = frame.props["Scenechange"] == 1
+                if scene_detection_scxvid_frames[current_frame]:
+                    scene_detection_scxvid[current_frame] = frame.props["_SceneChangePrev"] == 1
+            measured_frames += 1
+        assert measured_frames == source_num_frames, "This indicates a bug in the original code. Please report this to the repository including this entire error message."
+
+        if scene_detection_perform_vapoursynth:
+            print(f"\r\033[K{frame_print(measured_frames)} / VapourSynth based scene detection complete / {measured_frames / (time.time() - start):.2f} fps", end="\n", flush=True)
+        else:
+            print(f"\r\033[K{frame_print(measured_frames)} / Frame luminance measurement complete / {measured_frames / (time.time() - start):.2f} fps", end="\n", flush=True)
 
         if not scene_detection_diffs_available:
-            scene_detection_clip_base = scene_detection_clip_base.std.PlaneStats(scene_detection_clip_base[0] + scene_detection_clip_base, plane=0, prop="Luma")
-        
-        target_width = np.round(np.sqrt(1280 * 720 / scene_detection_clip_base.width / scene_detection_clip_base.height) * scene_detection_clip_base.width / 40) * 40
-        if target_width < scene_detection_clip_base.width * 0.9:
-            target_height = np.ceil(target_width / scene_detection_clip_base.width * scene_detection_clip_base.height / 2) * 2
-            src_height = target_height / target_width * scene_detection_clip_base.width
-            src_top = (scene_detection_clip_base.height - src_height) / 2
-            scene_detection_clip_base = scene_detection_clip_base.resize.Point(width=target_width, height=target_height, src_top=src_top, src_height=src_height,
-                                                                               format=vs.YUV420P8, dither_type="none")
+            scene_detection_luma.flush()
+            del scene_detection_luma, scene_detection_diffs, scene_detection_average, scene_detection_min, scene_detection_max
+            scene_detection_luma_temp_file.replace(scene_detection_luma_file)
+            scene_detection_luma = scene_detection_load_luma()
+            scene_detection_diffs, scene_detection_average, scene_detection_min, scene_detection_max = scene_detection_luma
+            scene_detection_diffs_available = True
 
+    if scene_detection_has_vapoursynth:
         zones_diffs = {}
         zones_vapoursynth_scenecut = {}
         zones_luma_scenecut = {}
         for zone_i, zone in enumerate(zones):
-            assert zone["zone"].scene_detection_method in ["av1an", "x264_vapoursynth", "vapoursynth", "external"], "Invalid `scene_detection_method`. Please check your config inside `Progression-Boost.py`."
-
             if zone["zone"].scene_detection_method in ["x264_vapoursynth", "vapoursynth"]:
-                assert zone["zone"].scene_detection_vapoursynth_method in ["wwxd", "wwxd_scxvid"], "Invalid `scene_detection_vapoursynth_method`. Please check your config inside `Progression-Boost.py`."
-                assert zone["zone"].scene_detection_vapoursynth_range in ["limited", "full"], "Invalid `scene_detection_vapoursynth_range`. Please check your config inside `Progression-Boost.py`."
-                assert zone["zone"].scene_detection_extra_split >= zone["zone"].scene_detection_min_scene_len * 2, "`scene_detection_method` `vapoursynth` does not support `scene_detection_extra_split` to be smaller than 2 times `scene_detection_min_scene_len`."
-
-                scene_detection_clip = scene_detection_clip_base[zone["start_frame"]:zone["end_frame"]]
-                scene_detection_clip = scene_detection_clip.wwxd.WWXD()
-                if zone["zone"].scene_detection_vapoursynth_method == "wwxd_scxvid":
-                    scene_detection_clip = scene_detection_clip.scxvid.Scxvid()
-
-                diffs = np.empty((scene_detection_clip.num_frames,), dtype=float)
-                vapoursynth_scenecut = np.zeros((scene_detection_clip.num_frames,), dtype=float)
-                luma_scenecut = np.zeros((scene_detection_clip.num_frames,), dtype=bool)
-                luma_scenecut_prev = True
-
-                start = time.time() - 0.000001
-                for offset_frame, frame in enumerate(scene_detection_clip.frames(backlog=48)):
-                    current_frame = zone["start_frame"] + offset_frame
-                    print(f"\r\033[K{frame_print(current_frame)} / Detecting scenes / {offset_frame / (time.time() - start):.2f} fps", end="", flush=True)
-
-                    if not scene_detection_diffs_available:
-                        scene_detection_diffs[current_frame] = frame.props["LumaDiff"]
-                        scene_detection_average[current_frame] = frame.props["LumaAverage"]
-                        scene_detection_min[current_frame] = frame.props["LumaMin"]
-                        scene_detection_max[current_frame] = frame.props["LumaMax"]
-                    diffs[offset_frame] = scene_detection_diffs[current_frame]
-
-                    if zone["zone"].scene_detection_vapoursynth_method == "wwxd":
-                        vapoursynth_scenecut[offset_frame] = frame.props["Scenechange"] == 1
-                    elif zone["zone"].scene_detection_vapoursynth_method == "wwxd_scxvid":
-                        vapoursynth_scenecut[offset_frame] = (frame.props["Scenechange"] == 1) + (frame.props["_SceneChangePrev"] == 1) / 2
-
-                    if zone["zone"].scene_detection_vapoursynth_range == "limited":
-                        luma_scenecut_current = scene_detection_min[current_frame] > 231.125 * 2 ** (scene_detection_bits - 8) or \
-                                                scene_detection_max[current_frame] < 19.875 * 2 ** (scene_detection_bits - 8)
-                    elif zone["zone"].scene_detection_vapoursynth_range == "full":
-                        luma_scenecut_current = scene_detection_min[current_frame] > 251.125 * 2 ** (scene_detection_bits - 8) or \
-                                                scene_detection_max[current_frame] < 3.875 * 2 ** (scene_detection_bits - 8)
-                    if luma_scenecut_current or luma_scenecut_prev:
-                        luma_scenecut[offset_frame] = True
-                    luma_scenecut_prev = luma_scenecut_current
+                diffs = np.array(scene_detection_diffs[zone["start_frame"]:zone["end_frame"]], dtype=float)
+
+                if zone["zone"].scene_detection_vapoursynth_method == "wwxd":
+                    vapoursynth_scenecut = scene_detection_wwxd[zone["start_frame"]:zone["end_frame"]].astype(float)
+                elif zone["zone"].scene_detection_vapoursynth_method == "wwxd_scxvid":
+                    vapoursynth_scenecut = scene_detection_wwxd[zone["start_frame"]:zone["end_frame"]] + \
+                                           scene_detection_scxvid[zone["start_frame"]:zone["end_frame"]] / 2
+
+                # A frame is marked if either itself or the frame before is
+                # almost completely black or white. The first frame of the
+                # zone is always marked.
+                if zone["zone"].scene_detection_vapoursynth_range == "limited":
+                    luma_scenecut_current = (scene_detection_min[zone["start_frame"]:zone["end_frame"]] > 231.125 * 2 ** (scene_detection_bits - 8)) | \
+                                            (scene_detection_max[zone["start_frame"]:zone["end_frame"]] < 19.875 * 2 ** (scene_detection_bits - 8))
+                elif zone["zone"].scene_detection_vapoursynth_range == "full":
+                    luma_scenecut_current = (scene_detection_min[zone["start_frame"]:zone["end_frame"]] > 251.125 * 2 ** (scene_detection_bits - 8)) | \
+                                            (scene_detection_max[zone["start_frame"]:zone["end_frame"]] < 3.875 * 2 ** (scene_detection_bits - 8))
+                luma_scenecut = luma_scenecut_current.copy()
+                luma_scenecut[0] = True
+                luma_scenecut[1:] |= luma_scenecut_current[:-1]
 
                 zones_diffs[zone_i] = diffs
                 zones_vapoursynth_scenecut[zone_i] = vapoursynth_scenecut
                 zones_luma_scenecut[zone_i] = luma_scenecut
 
-        print(f"\r\033[K{frame_print(current_frame + 1)} / VapourSynth based scene detection complete", end="\n", flush=True)
-
     if scene_detection_has_external:
         with input_scenes_file.open("r") as input_scenes_f:
             try:
@@ -1876,53 +2550,14 @@ if not resume or not scene_detection_scenes_file.exists():
         with scene_detection_av1an_scenes_file.open("r") as av1an_scenes_f:
             scene_detection_av1an_scenes = json.load(av1an_scenes_f)
 
-        assert scene_detection_av1an_scenes["frames"] == zone_default.source_clip.num_frames, "Unexpected result from av1an"
+        assert scene_detection_av1an_scenes["frames"] == source_num_frames, "Unexpected result from av1an"
         if "split_scenes" in scene_detection_av1an_scenes:
             scene_detection_av1an_scenes["scenes"] = scene_detection_av1an_scenes["split_scenes"]
         assert "scenes" in scene_detection_av1an_scenes, "Unexpected result from av1an"
 
 
-    if scene_detection_perform_x264:
-        if scene_detection_x264_process.poll() is None:
-            print(f"\r\033[K{frame_print(0)} / Performing x264 based scene detection", end="", flush=True)
-        scene_detection_x264_process.wait()
-        print(f"\r\033[K{frame_print(scene_detection_x264_total_frames_print)} / x264 based scene detection finished", end="\n", flush=True)
-
-        zones_x264_scenecut = {}
-        scene_detection_match_x264_I = re.compile(r"^in:(\d+) out:\d+ type:(\w)")
-        for zone_i, zone in enumerate(zones):
-            x264_scenecut = np.zeros((zone["end_frame"] - zone["start_frame"],), dtype=float)
-            def scene_detection_write_x264_scenecut(name, start_frame, end_frame, skip_starting_frames=False):
-                assert (scene_detection_x264_stats_dir / f"{name}.log").exists(), "Unexpected result from av1an or x264"
-                with (scene_detection_x264_stats_dir / f"{name}.log").open("r") as x264_stats_f:
-                    x264_stats = x264_stats_f.read()
-
-                for line in x264_stats.splitlines():
-                    if match := scene_detection_match_x264_I.match(line):
-                        try:
-                            offset_frame = int(match.group(1))
-                        except ValueError:
-                            raise ValueError("Unexpected result from av1an or x264")
-                        assert offset_frame + start_frame < end_frame, "Unexpected result from av1an or x264"
-
-                        if offset_frame == 0 and skip_starting_frames:
-                            continue
-
-                        if match.group(2) == "I":
-                            x264_scenecut[offset_frame + start_frame] = 1
-
-            if zone["end_frame"] - zone["start_frame"] < 120:
-                scene_detection_write_x264_scenecut(f"{zone_i}", 0, zone["end_frame"] - zone["start_frame"])
-            else:
-                scene_detection_write_x264_scenecut(f"{zone_i}_left", 0, math.floor((zone["end_frame"] - zone["start_frame"]) / 2) + 4)
-                scene_detection_write_x264_scenecut(f"{zone_i}_right", math.floor((zone["end_frame"] - zone["start_frame"]) / 2), zone["end_frame"] - zone["start_frame"],
-                                                                       skip_starting_frames=True)
-
-            zones_x264_scenecut[zone_i] = x264_scenecut
-
-
     scenes = {}
-    scenes["frames"] = zone_default.source_clip.num_frames
+    scenes["frames"] = source_num_frames
     scenes["scenes"] = []
     for zone_i, zone in enumerate(zones):
         if zone["zone"].scene_detection_method == "av1an":
@@ -1985,6 +2620,8 @@ if not resume or not scene_detection_scenes_file.exists():
             luma_scenecut = zones_luma_scenecut[zone_i]
             vapoursynth_scenecut = zones_vapoursynth_scenecut[zone_i]
             if zone["zone"].scene_detection_method == "x264_vapoursynth":
+                if scene_detection_perform_x264:
+                    scene_detection_wait_x264(zone_i)
                 x264_scenecut = zones_x264_scenecut[zone_i]
 
             diffs_half = diffs / 2
@@ -2004,8 +2641,6 @@ if not resume or not scene_detection_scenes_file.exists():
                 vapoursynth_scenecut += x264_scenecut
                 vapoursynth_scenecut[vapoursynth_scenecut > 1.0] = 1.0
             diffs[~luma_scenecut] += vapoursynth_scenecut[~luma_scenecut]
-            
-            diffs_sort = np.argsort(diffs, stable=True)[::-1]
 
             def scene_detection_split_scene(start_frame, end_frame):
                 assert zone["zone"].scene_detection_0042_still_scene_extra_split >= zone["zone"].scene_detection_extra_split, "Invalid `scene_detection_0042_still_scene_extra_split`. This value must be bigger than or equal to `scene_detection_extra_split`. Please check your config inside `Progression-Boost.py`."
@@ -2028,6 +2663,14 @@ if not resume or not scene_detection_scenes_file.exists():
                     return [start_frame]
 
 
+                # Every split below only ever picks a frame inside the current
+                # range, so instead of walking the sorted diffs of the whole zone
+                # for every pass, we sort only the frames inside the range. The
+                # stable sort reversed keeps ties in the same order as sorting
+                # the whole zone would.
+                diffs_sort = start_frame + np.argsort(diffs[start_frame:end_frame + 1], stable=True)[::-1]
+
+
 
                 if end_frame - start_frame >= 2 * zone["zone"].scene_detection_extra_split:
                     for current_frame in diffs_sort:
@@ -3174,18 +3817,34 @@ if not resume or not scene_detection_scenes_file.exists():
                                          "end_frame": start_frames[i + 1] + zone["start_frame"],
                                          "zone_overrides": None})
 
+    if scene_detection_perform_x264:
+        if not zone_default.scene_detection_x264_pipe:
+            scene_detection_x264_process.wait()
+        else:
+            assert not any(scene_detection_x264_pipes), "This indicates a bug in the original code. Please report this to the repository including this entire error message."
+            for x264_process in scene_detection_x264_processes:
+                assert x264_process.wait() == 0, "Unexpected result from x264"
+        print(f"\r\033[K{frame_print(scene_detection_x264_total_frames_print)} / x264 based scene detection finished", end="\n", flush=True)
+
+    if scene_detection_perform_vapoursynth:
+        scene_detection_detection_key_file.unlink(missing_ok=True)
+        scene_detection_detection = np.zeros((3, source_num_frames), dtype=bool)
+        scene_detection_detection[0] = scene_detection_wwxd
+        scene_detection_detection[1] = scene_detection_scxvid
+        if scene_detection_perform_x264:
+            for zone_i, x264_scenecut in zones_x264_scenecut.items():
+                scene_detection_detection[2][zones[zone_i]["start_frame"]:zones[zone_i]["end_frame"]] = x264_scenecut > 0
+        with scene_detection_detection_temp_file.open("wb") as detection_f:
+            np.save(detection_f, scene_detection_detection)
+        scene_detection_detection_temp_file.replace(scene_detection_detection_file)
+        with scene_detection_detection_key_file.open("w") as detection_key_f:
+            json.dump(scene_detection_detection_key, detection_key_f, cls=NumpyEncoder)
+
     print(f"\r\033[K{frame_scene_print(scenes["scenes"][-1]["start_frame"], scenes["scenes"][-1]["end_frame"])} / Scene creation complete", end="\n", flush=True)
 
     with scene_detection_scenes_file.open("w") as scenes_f:
         json.dump(scenes, scenes_f, cls=NumpyEncoder)
 
-    if not scene_detection_diffs_available:
-        np.savetxt(scene_detection_diffs_file, scene_detection_diffs, fmt="%.9f")
-        np.savetxt(scene_detection_average_file, scene_detection_average, fmt="%.9f")
-        np.savetxt(scene_detection_min_file, scene_detection_min, fmt="%.9f")
-        np.savetxt(scene_detection_max_file, scene_detection_max, fmt="%.9f")
-        scene_detection_diffs_available = True
-
     if scene_detection_perform_vapoursynth:
         print(f"\r\033[KTime {datetime.now().time().isoformat(timespec="seconds")} / Scene detection finished", end="\n", flush=True)
 
@@ -3231,12 +3890,12 @@ for zone_scene in zone_scenes["scenes"]:
     }
 
 
-#  ██████╗ ██████╗  ██████╗ ██████╗ ██╗███╗   ██╗ ██████╗       ███████╗██╗██████╗ ███████╗████████╗
-#  ██╔══██╗██╔══██╗██╔═══██╗██╔══██╗██║████╗  ██║██╔════╝       ██╔════╝██║██╔══██╗██╔════╝╚══██╔══╝
-#  ██████╔╝██████╔╝██║   ██║██████╔╝██║██╔██╗ ██║██║  ███╗█████╗█████╗  ██║██████╔╝███████╗   ██║   
-#  ██╔═══╝ ██╔══██╗██║   ██║██╔══██╗██║██║╚██╗██║██║   ██║╚════╝██╔══╝  ██║██╔══██╗╚════██║   ██║   
-#  ██║     ██║  ██║╚██████╔╝██████╔╝██║██║ ╚████║╚██████╔╝      ██║     ██║██║  ██║███████║   ██║   
-#  ╚═╝     ╚═╝  ╚═╝ ╚═════╝ ╚═════╝ ╚═╝╚═╝  ╚═══╝ ╚═════╝       ╚═╝     ╚═╝╚═╝  ╚═╝╚══════╝   ╚═╝   
+#  ██████╗ ██████╗  ██████╗ ██████╗ ██╗███╗   ██╗ ██████╗ 
+#  ██╔══██╗██╔══██╗██╔═══██╗██╔══██╗██║████╗  ██║██╔════╝ 
+#  ██████╔╝██████╔╝██║   ██║██████╔╝██║██╔██╗ ██║██║  ███╗
+#  ██╔═══╝ ██╔══██╗██║   ██║██╔══██╗██║██║╚██╗██║██║   ██║
+#  ██║     ██║  ██║╚██████╔╝██████╔╝██║██║ ╚████║╚██████╔╝
+#  ╚═╝     ╚═╝  ╚═╝ ╚═════╝ ╚═════╝ ╚═╝╚═╝  ╚═══╝ ╚═════╝ 
 
 
 scene_rjust_digits = math.floor(np.log10(len(scenes["scenes"]))) + 1
@@ -3264,24 +3923,190 @@ dc_X = np.arange(dc.shape[0])
 
 
 if metric_has_metric:
-    def probing_perform_probing(probing_tmp_dir, probing_scenes_file, probing_output_file, probing_output_file_cache):
-        probing_output_file.unlink(missing_ok=True)
-        if probing_output_file_cache is not None:
-            probing_output_file_cache.unlink(missing_ok=True)
+    # Each scene with `metric_enable` is probed using its own av1an process,
+    # with its own temporary directory and scenes file. av1an keeps the
+    # output of the probe encode in `encode` folder in its temporary
+    # directory and lists it in `done.json`.
+    # The output is linked into a separate folder before being opened, so
+    # that the index files created by `source_provider` don't end up in
+    # av1an's `encode` folder. Neither the concatenated output from av1an
+    # nor the whole probe encode is ever indexed.
+    # With `probing_native`, SvtAv1EncApp writes its output directly into
+    # this separate folder instead.
+    probing_chunks = {}
+    for scene_n, zone_scene in enumerate(zone_scenes["scenes"]):
+        if zone_scene["zone"].metric_enable:
+            probing_chunks[scene_n] = f"{len(probing_chunks):05}"
+
+    probing_dirs = {
+        "first": progression_boost_temp_dir / "probe-encode-first",
+        "second": progression_boost_temp_dir / "probe-encode-second"
+    }
+    probing_chunks_dirs = {
+        "first": progression_boost_temp_dir / "probe-encode-first.chunks",
+        "second": progression_boost_temp_dir / "probe-encode-second.chunks"
+    }
+
+    # Probe encodes written by older versions of Progression Boost, which
+    # encoded all scenes of a round into a single `probe-encode-*.mkv`.
+    # They can't be resumed from per scene, and are removed.
+    for probing_round in ["first", "second"]:
+        probing_legacy_files = [progression_boost_temp_dir / f"probe-encode-{probing_round}.tmp",
+                                progression_boost_temp_dir / f"probe-encode-{probing_round}.scenes.json",
+                                *progression_boost_temp_dir.glob(f"probe-encode-{probing_round}.mkv*")]
+        probing_legacy_files = [file for file in probing_legacy_files if file.exists()]
+        if probing_legacy_files:
+            print(f"\r\033[KFound the {probing_round} probe encode from an older version of Progression Boost in the temporary directory. It can't be resumed from and will be removed. The {probing_round} probe will be encoded again.", end="\n", flush=True)
+            for file in probing_legacy_files:
+                if file.is_dir():
+                    shutil.rmtree(file)
+                else:
+                    file.unlink()
+
+    def probing_read_done(probing_done_file):
+        if not probing_done_file.exists():
+            return {}
+        with probing_done_file.open("r") as done_f:
+            try:
+                done_scenes = json.load(done_f)
+            except json.JSONDecodeError:
+                return None
+        if "done" not in done_scenes:
+            return {}
+        return done_scenes["done"]
+
+    # Every probe encode is checked to have exactly as many frames as its
+    # scene, so that a probe encode that covers the wrong range of the
+    # source is caught before its metric is calculated. In IVF, every
+    # frame is a 12 byte frame header followed by the frame data.
+    def probing_count_ivf_frames(probing_file):
+        frames = 0
+        with probing_file.open("rb") as ivf_f:
+            header = ivf_f.read(32)
+            if len(header) != 32 or header[:4] != b"DKIF":
+                return None
+            ivf_f.seek(int.from_bytes(header[6:8], "little"))
+            while len(frame_header := ivf_f.read(12)) == 12:
+                ivf_f.seek(int.from_bytes(frame_header[:4], "little"), os.SEEK_CUR)
+                frames += 1
+        return frames
+
+    def probing_chunk_done(probing_round, scene_n):
+        if zone_default.probing_native:
+            return (probing_chunks_dirs[probing_round] / f"{probing_chunks[scene_n]}.ivf").exists()
+
+        done_scenes = probing_read_done(probing_dirs[probing_round] / probing_chunks[scene_n] / "done.json")
+        return done_scenes is not None and "00000" in done_scenes
+
+    # The qstep each probe encode is encoded at is recorded next to it, so
+    # that a second probe encode can be reused as long as the second qstep
+    # stays the same, even if `result.json` is deleted. The file is written
+    # to a `.tmp` file first and then moved into place, so it's never
+    # found empty or cut off.
+    def probing_read_qstep(probing_round, scene_n):
+        qstep_file = probing_chunks_dirs[probing_round] / f"{probing_chunks[scene_n]}.qstep"
+        if not qstep_file.exists():
+            return None
+        with qstep_file.open("r") as qstep_f:
+            try:
+                return int(qstep_f.read())
+            except ValueError:
+                return None
+
+    def probing_reset(probing_round, scene_n):
+        probing_tmp_dir = probing_dirs[probing_round] / probing_chunks[scene_n]
+        shutil.rmtree(probing_tmp_dir, ignore_errors=True)
+        probing_tmp_dir.with_suffix(".scenes.json").unlink(missing_ok=True)
+        probing_tmp_dir.with_suffix(".ivf").unlink(missing_ok=True)
+        if probing_chunks_dirs[probing_round].exists():
+            for file in probing_chunks_dirs[probing_round].glob(f"{probing_chunks[scene_n]}.*"):
+                file.unlink(missing_ok=True)
+
+    def probing_launch(probing_round, scene_n):
+        probing_reset(probing_round, scene_n)
+
+        zone_scene = zone_scenes["scenes"][scene_n]
+        probing_chunks_dirs[probing_round].mkdir(parents=True, exist_ok=True)
+        qstep_file = probing_chunks_dirs[probing_round] / f"{probing_chunks[scene_n]}.qstep"
+        with qstep_file.with_suffix(".qstep.tmp").open("w") as qstep_f:
+            qstep_f.write(str(metric_result["scenes"][scene_n][f"{probing_round}_qstep"]))
+        os.replace(qstep_file.with_suffix(".qstep.tmp"), qstep_file)
+        probing_crf = (np.searchsorted(dc, metric_result["scenes"][scene_n][f"{probing_round}_qstep"], side="right") - 1) / 4
+        probing_tmp_dir = probing_dirs[probing_round] / probing_chunks[scene_n]
+        probing_scenes_file = probing_tmp_dir.with_suffix(".scenes.json")
+        probing_output_file = probing_tmp_dir.with_suffix(".ivf")
+
+        probing_scene = {
+            "start_frame": zone_scene["start_frame"],
+            "end_frame": zone_scene["end_frame"],
+            "zone_overrides": copy.copy(zone_scene["zone_overrides"])
+        }
+        probing_scene["zone_overrides"]["encoder"] = zone_scene["zone"].probing_dynamic_encoder(zone_scene["start_frame"],
+                                                                                                zone_scene["end_frame"],
+                                                                                                scene_detection_average[zone_scene["start_frame"]:zone_scene["end_frame"]],
+                                                                                                scene_detection_min[zone_scene["start_frame"]:zone_scene["end_frame"]],
+                                                                                                scene_detection_max[zone_scene["start_frame"]:zone_scene["end_frame"]],
+                                                                                                scene_detection_diffs[zone_scene["start_frame"]:zone_scene["end_frame"]])
+        if zone_scene["zone"].quarterstep_crf:
+            probing_scene["zone_overrides"]["video_params"] = [
+                "--crf", f"{probing_crf:.2f}"
+            ]
+        else:
+            probing_scene["zone_overrides"]["video_params"] = [
+                "--crf", f"{probing_crf:.0f}"
+            ]
+        probing_scene["zone_overrides"]["video_params"] += [
+            "--preset", f"{zone_scene["zone"].probing_preset}",
+            *zone_scene["zone"].probing_dynamic_parameters(zone_scene["start_frame"],
+                                                           zone_scene["end_frame"],
+                                                           probing_crf,
+                                                           scene_detection_average[zone_scene["start_frame"]:zone_scene["end_frame"]],
+                                                           scene_detection_min[zone_scene["start_frame"]:zone_scene["end_frame"]],
+                                                           scene_detection_max[zone_scene["start_frame"]:zone_scene["end_frame"]],
+                                                           scene_detection_diffs[zone_scene["start_frame"]:zone_scene["end_frame"]])
+        ]
+        probing_scene["zone_overrides"]["photon_noise"] = None
+        probing_scene["zone_overrides"]["photon_noise_height"] = None
+        probing_scene["zone_overrides"]["photon_noise_width"] = None
+        probing_scene["zone_overrides"]["chroma_noise"] = False
+
+        if zone_default.probing_native:
+            return probing_launch_native(probing_round, scene_n, probing_scene)
+
+        # Same as the round-wide scenes files from earlier versions,
+        # `frames` is the total number of frames in the listed scenes, while
+        # `start_frame` and `end_frame` stay positions in the source. The
+        # output is checked against the length of the scene once the probe
+        # encode finishes.
+        probing_scenes = {}
+        probing_scenes["scenes"] = [probing_scene]
+        probing_scenes["frames"] = zone_scene["end_frame"] - zone_scene["start_frame"]
+        probing_scenes["split_scenes"] = probing_scenes["scenes"]
+
+        probing_tmp_dir.parent.mkdir(parents=True, exist_ok=True)
+        with probing_scenes_file.open("w") as probing_scenes_f:
+            json.dump(probing_scenes, probing_scenes_f, cls=NumpyEncoder)
             
         if zone_default.source_clip_cache_reuse and zone_default.source_clip_cache is not None:
             probing_tmp_dir_cache = probing_tmp_dir / "split" / "cache"
             probing_tmp_dir_cache = probing_tmp_dir_cache.with_suffix(zone_default.source_clip_cache.suffix)
             
-            if not probing_tmp_dir_cache.exists():
-                probing_tmp_dir_cache.parent.mkdir(parents=True, exist_ok=True)
+            probing_tmp_dir_cache.parent.mkdir(parents=True, exist_ok=True)
+            try:
+                os.link(zone_default.source_clip_cache, probing_tmp_dir_cache)
+            except OSError:
                 shutil.copy2(zone_default.source_clip_cache, probing_tmp_dir_cache)
 
+        probing_parameters = zone_default.probing_av1an_parameters(f"[K[0m[1;3m> Progression Boost [0m[3m{probing_dirs[probing_round].name} {probing_chunks[scene_n]}[0m[1;3m <[0m")
+        assert "--workers" not in probing_parameters, "`--workers` should not be set in `probing_av1an_parameters`. Use `probing_workers` instead. Please check your config inside `Progression-Boost.py`."
+
+        # Progress bars from multiple av1an processes running at the same
+        # time would overwrite each other.
         command = [
             "av1an",
             "-y"
         ]
-        if verbose < 2:
+        if verbose < 3:
             command += ["--quiet"]
         if verbose >= 3:
             command += ["--verbose"]
@@ -3289,8 +4114,6 @@ if metric_has_metric:
             "--temp", probing_tmp_dir,
             "--keep"
         ]
-        if resume:
-            command += ["--resume"]
         command += [
             "-i", probing_input_file
         ]
@@ -3299,166 +4122,261 @@ if metric_has_metric:
         command += [
             "-o", probing_output_file,
             "--scenes", probing_scenes_file,
-            *zone_default.probing_av1an_parameters(f"[K[0m[1;3m> Progression Boost [0m[3m{probing_output_file.stem}[0m[1;3m <[0m")
+            "--workers", "1",
+            *probing_parameters
         ]
-        return subprocess.Popen(command, text=True)
-    
-    probing_first_tmp_dir = progression_boost_temp_dir / f"probe-encode-first.tmp"
-    probing_first_done_file = probing_first_tmp_dir / "done.json"
-    probing_first_scenes_file = progression_boost_temp_dir / f"probe-encode-first.scenes.json"
-    probing_first_output_file = progression_boost_temp_dir / f"probe-encode-first.mkv"
-    probing_first_output_file_cache = zone_default.source_provider_cache(probing_first_output_file)
-    
-    probing_second_tmp_dir = progression_boost_temp_dir / f"probe-encode-second.tmp"
-    probing_second_done_file = probing_second_tmp_dir / "done.json"
-    probing_second_scenes_file = progression_boost_temp_dir / f"probe-encode-second.scenes.json"
-    probing_second_output_file = progression_boost_temp_dir / f"probe-encode-second.mkv"
-    probing_second_output_file_cache = zone_default.source_provider_cache(probing_second_output_file)
-
-    metric_result_file = progression_boost_temp_dir / f"result.json"
-
-    probing_first_perform_encode = False
-    probing_second_perform_encode = False
-
-    if resume and metric_result_file.exists():
-        with metric_result_file.open("r") as result_f:
-            metric_result = json.load(result_f)
-    else:
-        metric_result = copy.deepcopy(scenes)
-
-    if not resume or not probing_first_output_file.exists():
-        probing_first_perform_encode = True
-
-    if probing_first_perform_encode:
-        for scene_n, zone_scene in enumerate(zone_scenes["scenes"]):
-            if zone_scene["zone"].metric_enable:
-                if "first_score" in metric_result["scenes"][scene_n]:
-                    del metric_result["scenes"][scene_n]["first_score"]
-
-    for scene_n, zone_scene in enumerate(zone_scenes["scenes"]):
-        if zone_scene["zone"].metric_enable:
-            if "first_score" not in metric_result["scenes"][scene_n]:
-                probing_second_perform_encode = True
-                shutil.rmtree(probing_second_tmp_dir, ignore_errors=True)
-                break
+        return subprocess.Popen(command, text=True), None
+
+    if zone_default.probing_native:
+        # The source for probe encodes is only opened once a probe encode
+        # is actually launched. A source filter decodes frames for one
+        # instance one at a time, so every feeder running at the same time
+        # gets its own instance of the source. Instances are put back into
+        # `probing_native_clips` once their feeder finishes, so there are
+        # never more instances than probe encodes running at the same time.
+        # A video file from `--encode-input` is opened through a link in
+        # the temporary directory, so that its index is created there
+        # instead of next to the file.
+        probing_native_clips = []
+        probing_native_clips_lock = threading.Lock()
+        def probing_native_get_clip():
+            with probing_native_clips_lock:
+                if probing_native_clips:
+                    return probing_native_clips.pop()
+
+            if probing_input_file == input_file:
+                clip = zone_default.source_clip_provider()
+            else:
+                probing_native_input_file = progression_boost_temp_dir / f"probing-input{probing_input_file.suffix}"
+                if probing_native_input_file.exists() and not probing_native_input_file.samefile(probing_input_file):
+                    for file in progression_boost_temp_dir.glob("probing-input.*"):
+                        file.unlink(missing_ok=True)
+                if not probing_native_input_file.exists():
+                    try:
+                        os.link(probing_input_file, probing_native_input_file)
+                    except OSError:
+                        try:
+                            probing_native_input_file.symlink_to(probing_input_file.expanduser().resolve())
+                        except OSError:
+                            probing_native_input_file = probing_input_file
+                clip = zone_default.source_provider(probing_native_input_file)
+
+            # RGB sources carry no matrix, so BT.709 is assumed.
+            if clip.format.color_family == vs.RGB:
+                clip = clip.resize.Point(format=vs.YUV420P10, matrix_s="709", dither_type="none")
+            elif clip.format.id != vs.YUV420P10:
+                clip = clip.resize.Point(format=vs.YUV420P10, dither_type="none")
+            return clip
+
+        probing_native_errors = {}
+        def probing_native_feed(probing_round, scene_n, clip, start_frame, end_frame, probing_process):
+            try:
+                clip[start_frame:end_frame].output(probing_process.stdin, y4m=True)
+            except Exception as e:
+                probing_native_errors[(probing_round, scene_n)] = e
+            finally:
+                try:
+                    probing_process.stdin.close()
+                except OSError:
+                    pass
+                with probing_native_clips_lock:
+                    probing_native_clips.append(clip)
 
-    if not resume or not probing_second_output_file.exists():
-        probing_second_perform_encode = True
+    def probing_launch_native(probing_round, scene_n, probing_scene):
+        assert probing_scene["zone_overrides"]["encoder"] == "svt_av1", "`probing_native` only supports `\"svt_av1\"` from `probing_dynamic_encoder`. Please check your config inside `Progression-Boost.py`."
 
-    if probing_second_perform_encode:
-        for scene_n, zone_scene in enumerate(zone_scenes["scenes"]):
-            if zone_scene["zone"].metric_enable:
-                if "second_score" in metric_result["scenes"][scene_n]:
-                    del metric_result["scenes"][scene_n]["second_score"]
+        probing_chunks_dirs[probing_round].mkdir(parents=True, exist_ok=True)
+        probing_output_file = probing_chunks_dirs[probing_round] / f"{probing_chunks[scene_n]}.ivf.tmp"
 
-    with metric_result_file.open("w") as metric_result_f:
-        json.dump(metric_result, metric_result_f, cls=NumpyEncoder)
+        command = [
+            "SvtAv1EncApp",
+            "-i", "stdin",
+            "-b", probing_output_file,
+            *probing_scene["zone_overrides"]["video_params"]
+        ]
 
-if metric_has_metric and probing_first_perform_encode:
-    probing_first_scenes = {}
-    probing_first_scenes["scenes"] = []
-    total_frames = 0
-    for scene_n, zone_scene in enumerate(zone_scenes["scenes"]):
-        if zone_scene["zone"].metric_enable:
-            metric_result["scenes"][scene_n]["first_qstep"] = 343
-
-            total_frames += zone_scene["end_frame"] - zone_scene["start_frame"]
-            probing_scene = {
-                "start_frame": zone_scene["start_frame"],
-                "end_frame": zone_scene["end_frame"],
-                "zone_overrides": copy.copy(zone_scene["zone_overrides"])
-            }
-            probing_scene["zone_overrides"]["encoder"] = zone_scene["zone"].probing_dynamic_encoder(zone_scene["start_frame"],
-                                                                                                    zone_scene["end_frame"],
-                                                                                                    scene_detection_average[zone_scene["start_frame"]:zone_scene["end_frame"]],
-                                                                                                    scene_detection_min[zone_scene["start_frame"]:zone_scene["end_frame"]],
-                                                                                                    scene_detection_max[zone_scene["start_frame"]:zone_scene["end_frame"]],
-                                                                                                    scene_detection_diffs[zone_scene["start_frame"]:zone_scene["end_frame"]])
-            if zone_scene["zone"].quarterstep_crf:
-                probing_scene["zone_overrides"]["video_params"] = [
-                    "--crf", f"{(np.searchsorted(dc, metric_result["scenes"][scene_n]["first_qstep"], side="right") - 1) / 4:.2f}"
-                ]
-            else:
-                probing_scene["zone_overrides"]["video_params"] = [
-                    "--crf", f"{(np.searchsorted(dc, metric_result["scenes"][scene_n]["first_qstep"], side="right") - 1) / 4:.0f}"
-                ]
-            probing_scene["zone_overrides"]["video_params"] += [
-                "--preset", f"{zone_scene["zone"].probing_preset}",
-                *zone_scene["zone"].probing_dynamic_parameters(zone_scene["start_frame"],
-                                                               zone_scene["end_frame"],
-                                                               (np.searchsorted(dc, metric_result["scenes"][scene_n]["first_qstep"], side="right") - 1) / 4,
-                                                               scene_detection_average[zone_scene["start_frame"]:zone_scene["end_frame"]],
-                                                               scene_detection_min[zone_scene["start_frame"]:zone_scene["end_frame"]],
-                                                               scene_detection_max[zone_scene["start_frame"]:zone_scene["end_frame"]],
-                                                               scene_detection_diffs[zone_scene["start_frame"]:zone_scene["end_frame"]])
+        if probing_input_file.suffix.lower() == ".vpy":
+            vspipe_command = [
+                "vspipe",
+                "-c", "y4m"
             ]
-            probing_scene["zone_overrides"]["photon_noise"] = None
-            probing_scene["zone_overrides"]["photon_noise_height"] = None
-            probing_scene["zone_overrides"]["photon_noise_width"] = None
-            probing_scene["zone_overrides"]["chroma_noise"] = False
-            probing_first_scenes["scenes"].append(probing_scene)
-    probing_first_scenes["frames"] = total_frames
-    probing_first_scenes["split_scenes"] = probing_first_scenes["scenes"]
-
-    with metric_result_file.open("w") as metric_result_f:
-        json.dump(metric_result, metric_result_f, cls=NumpyEncoder)
-            
-    with probing_first_scenes_file.open("w") as probing_scenes_f:
-        json.dump(probing_first_scenes, probing_scenes_f, cls=NumpyEncoder)
+            if probing_input_vspipe_args is not None:
+                for arg in probing_input_vspipe_args:
+                    vspipe_command += ["-a", arg]
+            vspipe_command += [
+                "-s", str(probing_scene["start_frame"]),
+                "-e", str(probing_scene["end_frame"] - 1),
+                probing_input_file, "-"
+            ]
+            vspipe_process = subprocess.Popen(vspipe_command, stdout=subprocess.PIPE,
+                                              stderr=None if verbose >= 3 else subprocess.DEVNULL)
+            probing_process = subprocess.Popen(command, stdin=vspipe_process.stdout,
+                                               stdout=None if verbose >= 3 else subprocess.DEVNULL,
+                                               stderr=None if verbose >= 3 else subprocess.DEVNULL)
+            vspipe_process.stdout.close()
+            return probing_process, vspipe_process
+        else:
+            probing_process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                               stdout=None if verbose >= 3 else subprocess.DEVNULL,
+                                               stderr=None if verbose >= 3 else subprocess.DEVNULL)
+            probing_feeder = threading.Thread(target=probing_native_feed,
+                                              args=(probing_round, scene_n, probing_native_get_clip(), probing_scene["start_frame"], probing_scene["end_frame"], probing_process),
+                                              daemon=True)
+            probing_feeder.start()
+            return probing_process, probing_feeder
+
+    def probing_finish(probing_round, scene_n, probing_process, probing_feeder):
+        scene_frames = zone_scenes["scenes"][scene_n]["end_frame"] - zone_scenes["scenes"][scene_n]["start_frame"]
+        if not zone_default.probing_native:
+            assert probing_process.returncode == 0 and probing_chunk_done(probing_round, scene_n), f"Unexpected result from av1an in the {probing_round} probe for {scene_frame_print(scene_n)}."
+            assert probing_count_ivf_frames(probing_dirs[probing_round] / probing_chunks[scene_n] / "encode" / "00000.ivf") == scene_frames, f"Unexpected result from av1an in the {probing_round} probe for {scene_frame_print(scene_n)}. The probe encode doesn't have the same number of frames as the scene."
+            # Metric is calculated from the chunk in av1an's `encode` folder,
+            # and the concatenated output is only a copy of it.
+            (probing_dirs[probing_round] / probing_chunks[scene_n]).with_suffix(".ivf").unlink(missing_ok=True)
+            return
+
+        if isinstance(probing_feeder, subprocess.Popen):
+            assert probing_feeder.wait() == 0, f"Unexpected result from vspipe in the {probing_round} probe for {scene_frame_print(scene_n)}."
+        else:
+            probing_feeder.join()
+            if (probing_round, scene_n) in probing_native_errors:
+                raise probing_native_errors[(probing_round, scene_n)]
+        assert probing_process.returncode == 0, f"Unexpected result from SvtAv1EncApp in the {probing_round} probe for {scene_frame_print(scene_n)}."
+
+        probing_output_file = probing_chunks_dirs[probing_round] / f"{probing_chunks[scene_n]}.ivf"
+        assert probing_count_ivf_frames(probing_output_file.with_suffix(".ivf.tmp")) == scene_frames, f"Unexpected result from SvtAv1EncApp in the {probing_round} probe for {scene_frame_print(scene_n)}. The probe encode doesn't have the same number of frames as the scene."
+        probing_output_file.with_suffix(".ivf.tmp").rename(probing_output_file)
+
+    def probing_chunk_file(probing_round, scene_n):
+        if zone_default.probing_native:
+            probing_chunk_file = probing_chunks_dirs[probing_round] / f"{probing_chunks[scene_n]}.ivf"
+            assert probing_chunk_file.exists(), f"Could not find the output of the {probing_round} probe for {scene_frame_print(scene_n)}. Please delete everything in `progression-boost` folder inside the temporary directory, and then rerun the script."
+            return probing_chunk_file
+
+        chunk_file = probing_dirs[probing_round] / probing_chunks[scene_n] / "encode" / "00000.ivf"
+        assert chunk_file.exists(), f"Could not find the output of the {probing_round} probe for {scene_frame_print(scene_n)}. Please delete everything in `progression-boost` folder inside the temporary directory, and then rerun the script."
+
+        probing_chunks_dirs[probing_round].mkdir(parents=True, exist_ok=True)
+        probing_chunk_file = probing_chunks_dirs[probing_round] / f"{probing_chunks[scene_n]}.ivf"
+        if not probing_chunk_file.exists():
+            try:
+                os.link(chunk_file, probing_chunk_file)
+            except OSError:
+                shutil.copy2(chunk_file, probing_chunk_file)
+        return probing_chunk_file
+
+    metric_result_file = progression_boost_temp_dir / f"result.json"
+    metric_result_journal = SceneJournal(metric_result_file)
 
-    probing_first_process = probing_perform_probing(probing_first_tmp_dir, probing_first_scenes_file, probing_first_output_file, probing_first_output_file_cache)
+    if resume and metric_result_file.exists():
+        metric_result = metric_result_journal.load()
+    else:
+        metric_result = copy.deepcopy(scenes)
 
-    if verbose < 2:
-        probing_first_start = time.time() - 0.000001
-        probing_first_done_scenes_len_start = 0
-        if probing_first_done_file.exists():
-            with probing_first_done_file.open("r") as done_f:
-                done_scenes = None
-                try:
-                    done_scenes = json.load(done_f)
-                except json.JSONDecodeError:
-                    pass
-                    
-                if done_scenes is not None and "done" in done_scenes:
-                    probing_first_done_scenes_len_start = len(done_scenes["done"])
+    if not resume:
+        for probing_round in ["first", "second"]:
+            shutil.rmtree(probing_dirs[probing_round], ignore_errors=True)
+            shutil.rmtree(probing_chunks_dirs[probing_round], ignore_errors=True)
 
 
 if character_has_character:
     character_file = character_boost_temp_dir / "kyara.json"
+    character_journal = SceneJournal(character_file)
 
     if resume and character_file.exists():
-        with character_file.open("r") as character_f:
-            character_kyara = json.load(character_f)
+        character_kyara = character_journal.load()
     else:
         character_kyara = copy.deepcopy(scenes)
+        character_journal.save(character_kyara)
 
-    import vsmlrt
-
-    character_clip = zone_default.source_clip
-
-    character_block_width = math.ceil(character_clip.width / 64)
-    character_block_height = math.ceil(character_clip.height / 64)
-    character_clip = character_clip.resize.Bicubic(filter_param_a=0, filter_param_b=0.5, \
-                                                   width=character_block_width*64, height=character_block_height*64, src_width=character_block_width*64, src_height=character_block_height*64, \
-                                                   format=vs.RGBS, primaries_in=1, matrix_in=1, transfer_in=1, range_in=0, transfer=13, range=1)
-    character_clip = vsmlrt.inference(character_clip, character_model, backend=character_backend)
-    character_clip = character_clip.akarin.Expr("x 0.25 > x 0 ?")
-
-    character_clip = character_clip.std.PlaneStats(prop="Kyara")
-
-    character_clip = character_clip.std.Maximum()
-    character_clip = character_clip.resize.Bicubic(filter_param_a=0, filter_param_b=0, \
-                                                   width=character_block_width, height=character_block_height)
-    character_clip = character_clip.akarin.Expr("""
-    x[-1,-1] x[-1,0] x[-1,1]
-    x[0,-1]          x[0,1]
-    x[1,-1]  x[1,0]  x[1,1]
-    + + + + + + + sur!
-    x sur@ 0.75 pow * sur@ 8 / max
-    1 min
-    """)
-
-    def character_calculate_character(character_map_file, scene_n):
+    character_block_width = math.ceil(zone_default.source_clip.width / 64)
+    character_block_height = math.ceil(zone_default.source_clip.height / 64)
+
+    def character_build_clip(resolution, tiles, overlap):
+        assert tiles >= 1 and overlap % 16 == 0, "Invalid `character_inference_tiles` or `character_inference_tile_overlap`. Please check your config inside `Progression-Boost.py`."
+
+        # The model is always run at a multiple of 32 on each tile. The
+        # frame is never upscaled for inference.
+        if resolution is None:
+            scale = 1.0
+        else:
+            scale = min(resolution / max(character_block_width * 64, character_block_height * 64), 1.0)
+        width = max(round(character_block_width * 64 * scale / (32 * tiles)), 1) * 32 * tiles
+        height = max(round(character_block_height * 64 * scale / (32 * tiles)), 1) * 32 * tiles
+
+        clip = zone_default.source_clip
+        clip = clip.resize.Bicubic(filter_param_a=0, filter_param_b=0.5, \
+                                   width=width, height=height, src_width=character_block_width*64, src_height=character_block_height*64, \
+                                   format=vs.RGBS, primaries_in=1, matrix_in=1, transfer_in=1, range_in=0, transfer=13, range=1)
+        if tiles == 1:
+            clip = vsmlrt.inference(clip, character_model, backend=character_backend)
+        else:
+            # All tiles of a frame are interleaved into a single clip so
+            # that they go through one instance of the model, and are then
+            # taken back apart and stacked into the frame.
+            tile_width = width // tiles
+            tile_height = height // tiles
+            padded = clip.std.AddBorders(left=overlap, right=overlap, top=overlap, bottom=overlap)
+            tiled = []
+            for y in range(tiles):
+                for x in range(tiles):
+                    tiled.append(padded.std.CropAbs(width=tile_width + overlap * 2, height=tile_height + overlap * 2, left=x * tile_width, top=y * tile_height))
+            tiled = vsmlrt.inference(core.std.Interleave(tiled), character_model, backend=character_backend)
+            rows = []
+            for y in range(tiles):
+                row = []
+                for x in range(tiles):
+                    tile = tiled.std.SelectEvery(cycle=tiles * tiles, offsets=y * tiles + x)
+                    row.append(tile.std.Crop(left=overlap, right=overlap, top=overlap, bottom=overlap))
+                rows.append(core.std.StackHorizontal(row))
+            clip = core.std.StackVertical(rows)
+        clip = clip.akarin.Expr("x 0.25 > x 0 ?")
+
+        clip = clip.std.PlaneStats(prop="Kyara")
+
+        clip = clip.std.Maximum()
+        clip = clip.resize.Bicubic(filter_param_a=0, filter_param_b=0, \
+                                   width=character_block_width, height=character_block_height)
+        clip = clip.akarin.Expr("""
+        x[-1,-1] x[-1,0] x[-1,1]
+        x[0,-1]          x[0,1]
+        x[1,-1]  x[1,0]  x[1,1]
+        + + + + + + + sur!
+        x sur@ 0.75 pow * sur@ 8 / max
+        1 min
+        """)
+        return clip
+
+    # Character maps of all scenes are kept in a single float32 array in
+    # `map.npy` of shape `(slots, blocks)`, with one slot for every 4
+    # frames. Scene n occupies the slots from `character_offsets[n]` to
+    # `character_offsets[n + 1]`, and the offsets are recorded in
+    # `map-offsets.npy`. The array is preallocated and memory mapped, and
+    # each scene's map is written in place once its segmentation
+    # completes. A scene's map is only valid once its `kyara` has been
+    # recorded in `kyara.json`.
+    character_store_file = character_boost_temp_dir / "map.npy"
+    character_offsets_file = character_boost_temp_dir / "map-offsets.npy"
+    character_offsets = np.zeros((len(scenes["scenes"]) + 1,), dtype=np.int64)
+    for scene_n, scene in enumerate(scenes["scenes"]):
+        character_offsets[scene_n + 1] = character_offsets[scene_n] + math.ceil((scene["end_frame"] - scene["start_frame"]) / 4)
+
+    if resume and character_store_file.exists() and character_offsets_file.exists() and \
+       np.array_equal(np.load(character_offsets_file), character_offsets) and \
+       np.load(character_store_file, mmap_mode="r").shape == (character_offsets[-1], character_block_width * character_block_height):
+        character_store = np.load(character_store_file, mmap_mode="r+")
+    else:
+        character_store = np.lib.format.open_memmap(character_store_file, mode="w+", dtype=np.float32, shape=(character_offsets[-1], character_block_width * character_block_height))
+        np.save(character_offsets_file, character_offsets)
+        for scene in character_kyara["scenes"]:
+            if "kyara" in scene:
+                del scene["kyara"]
+        character_journal.save(character_kyara)
+    # Character maps written by older versions of Progression Boost
+    for file in character_boost_temp_dir.glob("character-*.npy"):
+        file.unlink()
+
+    def character_select_frames(scene_n):
         diffs = scene_detection_diffs[scenes["scenes"][scene_n]["start_frame"]:scenes["scenes"][scene_n]["end_frame"]]
         frames = np.zeros((math.ceil(diffs.shape[0] / 32) * 32 + 1,), dtype=bool)
 
@@ -3470,90 +4388,158 @@ if character_has_character:
                 frames[[math.floor(frame / 16) * 16, math.ceil(frame / 16) * 16]] = True
                 frames[[math.floor(frame / 32) * 32, math.ceil(frame / 32) * 32]] = True
 
-        character_map = np.full((math.ceil((scenes["scenes"][scene_n]["end_frame"] - scenes["scenes"][scene_n]["start_frame"]) / 4), character_block_width * character_block_height),
-                                np.nan, dtype=np.float64)
-
-        clip = character_clip[int(scenes["scenes"][scene_n]["start_frame"])]
-        clip_map = [0]
-        for i in range(1, character_map.shape[0]):
-            if frames[i * 4]:
-                clip += character_clip[int(scenes["scenes"][scene_n]["start_frame"] + i * 4)]
+        candidates = [i for i in range(math.ceil((scenes["scenes"][scene_n]["end_frame"] - scenes["scenes"][scene_n]["start_frame"]) / 4)) if frames[i * 4]]
+
+        # Frames that have barely changed since the last frame the model is
+        # run on reuse its map, and are returned separately as `propagated`
+        # together with the slot they are propagated from.
+        threshold = zone_scenes["scenes"][scene_n]["zone"].character_propagation_threshold
+        if threshold is None:
+            return candidates, {}
+        clip_map = [candidates[0]]
+        propagated = {}
+        for i in candidates[1:]:
+            if np.sum(diffs[clip_map[-1] * 4 + 1:i * 4 + 1]) > threshold:
                 clip_map.append(i)
+            else:
+                propagated[i] = clip_map[-1]
+        return clip_map, propagated
+
+    # Character segmentation runs in its own background thread through
+    # the probe encode, metric and final stages. The frames to segment in
+    # all scenes are collected into `character_frames` up front, and
+    # `character_work` requests them from `character_clip` in a single
+    # pass, with up to `character_prefetch` requests in flight. The
+    # results are scattered back into `character_maps` for each scene,
+    # and `character_done` is set for each scene once its map is written,
+    # so that the final stage only waits on the scene it is currently
+    # working on.
+    character_done = {}
+    for scene_n, zone_scene in enumerate(zone_scenes["scenes"]):
+        if zone_scene["zone"].character_enable:
+            character_done[scene_n] = threading.Event()
+            if "kyara" in character_kyara["scenes"][scene_n]:
+                character_done[scene_n].set()
+
+    character_frames = []
+    character_remaining = {}
+    character_propagated = {}
+    for scene_n, done in character_done.items():
+        if not done.is_set():
+            clip_map, character_propagated[scene_n] = character_select_frames(scene_n)
+            character_remaining[scene_n] = len(clip_map)
+            for i in clip_map:
+                character_frames.append((scene_n, i, int(scenes["scenes"][scene_n]["start_frame"] + i * 4)))
+
+    character_maps = {}
+    character_errors = []
+    character_calculated = 0
+    character_propagated_count = sum([len(propagated) for propagated in character_propagated.values()])
+
+    # The model is only loaded if there are frames left to segment, which
+    # is not the case when resuming after character segmentation has
+    # finished for every scene.
+    if character_frames or character_benchmark is not None:
+        import vsmlrt
 
-        character_kyara["scenes"][scene_n]["kyara"] = 0.0
-        for i, frame in enumerate(clip.frames(backlog=48)):
-            character_map[clip_map[i]] = np.array(frame[0], dtype=np.float32).reshape((-1,))
-            character_kyara["scenes"][scene_n]["kyara"] = np.max([frame.props["KyaraAverage"], character_kyara["scenes"][scene_n]["kyara"]])
-
-        np.save(character_map_file, character_map)
-        with character_file.open("w") as character_f:
-            json.dump(character_kyara, character_f, cls=NumpyEncoder)
-
-    character_precalc = 0
-
-if metric_has_metric and probing_first_perform_encode and character_has_character:
-    start = time.time() - 0.000001
-    start_count = -1
-    for scene_n in range(0, len(scenes["scenes"])):
-        if zone_scenes["scenes"][scene_n]["zone"].character_enable:
-            character_precalc = scene_n
-
-            if probing_first_process.poll() is not None:
-                print(f"\r\033[K{scene_frame_print(scene_n)} / Character segmentation paused / {start_count / (time.time() - start):.2f} scenes per second", end="\n", flush=True)
-                break
-
-            character_map_file = character_boost_temp_dir / f"character-{scene_rjust(scene_n)}.npy"
-            if not resume or not character_map_file.exists() or "kyara" not in character_kyara["scenes"][scene_n]:
-                start_count += 1
-                print(f"\r\033[K{scene_frame_print(scene_n)} / Performing character segmentation / {start_count / (time.time() - start):.2f} scenes per second", end="", flush=True)
-
-                character_calculate_character(character_map_file, scene_n)
-    else:
-        character_precalc = len(scenes["scenes"])
-        if start_count != -1:
-            print(f"\r\033[K{scene_frame_print(scene_n)} / Character segmentation complete / {(start_count + 1) / (time.time() - start):.2f} scenes per second", end="\n", flush=True)
-
-
-if metric_has_metric and probing_first_perform_encode:
-    if verbose < 2:
-        if probing_first_process.poll() is not None:
-            print(f"\r\033[KScene {scene_rjust(len(probing_first_scenes["scenes"]))}/{scene_rjust(len(probing_first_scenes["scenes"]))} / First probe complete", end="\n", flush=True)
-        else:
-            while True:
-                if probing_first_process.poll() is not None:
-                    break
-
-                if probing_first_done_file.exists():
-                    with probing_first_done_file.open("r") as done_f:
-                        done_scenes_len_previous = probing_first_done_scenes_len_start
-                        while True:
-                            if probing_first_process.poll() is not None:
-                                break
-
-                            done_scenes = None
-                            done_f.seek(0)
-                            try:
-                                done_scenes = json.load(done_f)
-                            except json.JSONDecodeError:
-                                time.sleep(1 / 6000 * 1001)
-                                continue
-
-                            if done_scenes is not None and "done" in done_scenes:
-                                if (done_scenes_len := len(done_scenes["done"])) != done_scenes_len_previous or done_scenes_len == 0:
-                                    print(f"\r\033[KScene {scene_rjust(done_scenes_len)}/{scene_rjust(len(probing_first_scenes["scenes"]))} / Performing first probe / {(done_scenes_len - probing_first_done_scenes_len_start) / (time.time() - probing_first_start):.2f} scenes per second", end="", flush=True)
-                                    done_scenes_len_previous = done_scenes_len
-
-                            time.sleep(1 / 6000 * 1001)
-                    break
-
-            time.sleep(1 / 6000 * 1001)
-
-            print(f"\r\033[KScene {scene_rjust(len(probing_first_scenes["scenes"]))}/{scene_rjust(len(probing_first_scenes["scenes"]))} / First probe complete / {(len(probing_first_scenes["scenes"]) - probing_first_done_scenes_len_start) / (time.time() - probing_first_start):.2f} scenes per second", end="\n", flush=True)
-    else:
-        probing_first_process.wait()
-    
-    assert probing_first_output_file.exists()
-
+        character_clip = character_build_clip(zone_default.character_inference_resolution, zone_default.character_inference_tiles, zone_default.character_inference_tile_overlap)
+
+    def character_collect(scene_n, i, frame):
+        global character_calculated
+        if scene_n not in character_maps:
+            character_maps[scene_n] = np.full((character_offsets[scene_n + 1] - character_offsets[scene_n], character_block_width * character_block_height),
+                                              np.nan, dtype=np.float32)
+            character_kyara["scenes"][scene_n]["kyara"] = 0.0
+
+        character_maps[scene_n][i] = np.array(frame[0], dtype=np.float32).reshape((-1,))
+        character_kyara["scenes"][scene_n]["kyara"] = np.max([frame.props["KyaraAverage"], character_kyara["scenes"][scene_n]["kyara"]])
+
+        character_remaining[scene_n] -= 1
+        if character_remaining[scene_n] == 0:
+            propagated = character_propagated.pop(scene_n)
+            for i, source in propagated.items():
+                character_maps[scene_n][i] = character_maps[scene_n][source]
+            character_kyara["scenes"][scene_n]["propagated"] = list(propagated)
+
+            character_store[character_offsets[scene_n]:character_offsets[scene_n + 1]] = character_maps.pop(scene_n)
+            character_store.flush()
+            character_journal.update(character_kyara, scene_n)
+            character_calculated += 1
+            character_done[scene_n].set()
+
+    def character_stream(clip, frames):
+        requests = deque()
+        for frame in frames:
+            requests.append(clip.get_frame_async(frame))
+            if len(requests) >= zone_default.character_prefetch:
+                yield requests.popleft().result()
+        while requests:
+            yield requests.popleft().result()
+
+    def character_work():
+        try:
+            for (scene_n, i, _), frame in zip(character_frames, character_stream(character_clip, [frame for scene_n, i, frame in character_frames])):
+                character_collect(scene_n, i, frame)
+        except Exception as e:
+            character_errors.append(e)
+            for done in character_done.values():
+                done.set()
+
+    def character_wait(scene_n):
+        if not character_done[scene_n].is_set():
+            print(f"\r\033[K{scene_frame_print(scene_n)} / Waiting for character segmentation", end="", flush=True)
+            character_done[scene_n].wait()
+        if character_errors:
+            raise character_errors[0]
+
+    # `--character-benchmark` runs the configured inference settings and
+    # full resolution inference over the same frames, spread evenly
+    # across the episode, and compares their speed and maps.
+    if character_benchmark is not None:
+        benchmark_frames = [int(scenes["scenes"][scene_n]["start_frame"] + i * 4) for scene_n in character_done for i in character_select_frames(scene_n)[0]]
+        benchmark_frames = [benchmark_frames[i] for i in np.unique(np.linspace(0, len(benchmark_frames) - 1, num=min(character_benchmark, len(benchmark_frames)), dtype=np.int64))]
+
+        benchmark_results = {}
+        for benchmark_name, benchmark_clip in [("Full resolution", character_build_clip(None, 1, 0)), ("Configured", character_clip)]:
+            benchmark_maps = np.empty((len(benchmark_frames), character_block_width * character_block_height), dtype=np.float32)
+            benchmark_kyara = np.empty((len(benchmark_frames),), dtype=np.float32)
+            benchmark_start = time.time() - 0.000001
+            for i, frame in enumerate(character_stream(benchmark_clip, benchmark_frames)):
+                print(f"\r\033[KFrame {frame_rjust(benchmark_frames[i])} / Benchmarking Character Boost / {benchmark_name} / {(i + 1) / (time.time() - benchmark_start):.2f} frames per second", end="", flush=True)
+                benchmark_maps[i] = np.array(frame[0], dtype=np.float32).reshape((-1,))
+                benchmark_kyara[i] = frame.props["KyaraAverage"]
+            benchmark_results[benchmark_name] = (benchmark_maps, benchmark_kyara, len(benchmark_frames) / (time.time() - benchmark_start))
+            print(f"\r\033[K{benchmark_name} / {benchmark_results[benchmark_name][2]:.2f} frames per second", end="\n", flush=True)
+
+        benchmark_diff = np.abs(benchmark_results["Configured"][0] - benchmark_results["Full resolution"][0])
+        benchmark_record = {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "input": str(input_file),
+            "width": zone_default.source_clip.width,
+            "height": zone_default.source_clip.height,
+            "frames": len(benchmark_frames),
+            "backend": repr(character_backend),
+            "character_inference_resolution": zone_default.character_inference_resolution,
+            "character_inference_tiles": zone_default.character_inference_tiles,
+            "character_inference_tile_overlap": zone_default.character_inference_tile_overlap,
+            "full_resolution_fps": benchmark_results["Full resolution"][2],
+            "configured_fps": benchmark_results["Configured"][2],
+            "speed": benchmark_results["Configured"][2] / benchmark_results["Full resolution"][2],
+            "map_difference_mean": np.mean(benchmark_diff),
+            "map_difference_99th_percentile": np.percentile(benchmark_diff, 99),
+            "kyara_average_difference_mean": np.mean(np.abs(benchmark_results["Configured"][1] - benchmark_results["Full resolution"][1]))
+        }
+        with (temp_dir / "character-benchmark.jsonl").open("a") as benchmark_f:
+            benchmark_f.write(json.dumps(benchmark_record, cls=NumpyEncoder) + "\n")
+
+        print(f"\r\033[KConfigured / {benchmark_record["speed"]:.2f}x speed / map difference mean {benchmark_record["map_difference_mean"]:.4f} 99th percentile {benchmark_record["map_difference_99th_percentile"]:.4f} / KyaraAverage difference mean {benchmark_record["kyara_average_difference_mean"]:.4f}", end="\n", flush=True)
+        print(f"\r\033[KBenchmark result appended to \"{temp_dir / "character-benchmark.jsonl"}\"", end="\n", flush=True)
+        raise SystemExit(0)
+
+    if character_frames:
+        character_start = time.time() - 0.000001
+        character_worker = threading.Thread(target=character_work, daemon=True)
+        character_worker.start()
 
 if metric_has_metric:
     for zone in zones:
@@ -3570,443 +4556,522 @@ if metric_has_metric:
         metric_method_has_ffvship = False
 
     metric_processed_reference = {}
-    metric_first = zone_default.source_provider(probing_first_output_file)
-    metric_processed_first = {}
-
-    metric_diff_clips = {}
-    if metric_method_has_vapoursynth:
-        metric_first_metric_clips = {}
+    def metric_get_reference(zone):
+        if zone not in metric_processed_reference:
+            metric_processed_reference[zone] = zone.metric_process(zone.metric_reference)
+        return metric_processed_reference[zone]
 
     if metric_method_has_ffvship:
-        metric_ffvship_output_file = progression_boost_temp_dir / "metric-ffvship.json"
+        metric_ffvship_output_dir = progression_boost_temp_dir / "metric-ffvship"
+        shutil.rmtree(metric_ffvship_output_dir, ignore_errors=True)
+        metric_ffvship_output_dir.mkdir(parents=True, exist_ok=True)
         metric_ffvship_source_cache = progression_boost_temp_dir / "metric-ffvship-source.ffindex"
-        metric_ffvship_first_cache = progression_boost_temp_dir / "metric-ffvship-first.ffindex"
+        # FFVship creates the source index as soon as it starts writing it.
+        # The index is only marked complete in `metric-ffvship-source.done`
+        # after an FFVship process that created it has exited successfully,
+        # and any index left without the mark is from an interrupted run.
+        metric_ffvship_source_cache_done = progression_boost_temp_dir / "metric-ffvship-source.done"
+        if not metric_ffvship_source_cache_done.exists():
+            metric_ffvship_source_cache.unlink(missing_ok=True)
 
         if zone_default.source_clip_cache_reuse and zone_default.source_clip_cache is not None and zone_default.source_clip_cache.suffix == ".ffindex":
-            if not metric_ffvship_source_cache.exists():
+            if not metric_ffvship_source_cache_done.exists():
                 metric_ffvship_source_cache.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(zone_default.source_clip_cache, metric_ffvship_source_cache)
-
-    start = time.time() - 0.000001
-    start_count = -1
-    probing_frame_head = 0
-    for scene_n, zone_scene in enumerate(zone_scenes["scenes"]):
-        if zone_scene["zone"].metric_enable:
-            if "first_score" not in metric_result["scenes"][scene_n]:
-                start_count += 1
-                print(f"\r\033[K{scene_frame_print(scene_n)} / Calculating metric / {start_count / (time.time() - start):.2f} scenes per second", end="", flush=True)
-    
-                assert zone_scene["zone"].metric_method in ["ffvship", "vapoursynth"], "Invalid `metric_method`. Please check your config inside `Progression-Boost.py`."
+                shutil.copy2(zone_default.source_clip_cache, metric_ffvship_source_cache.with_suffix(".ffindex.tmp"))
+                metric_ffvship_source_cache.with_suffix(".ffindex.tmp").replace(metric_ffvship_source_cache)
+                metric_ffvship_source_cache_done.touch()
+
+    # With `metric_highest_probing_diff_after_brackets`, the probe encode
+    # is decoded only once for both `metric_highest_probing_diff_frames`
+    # and metric calculation. While calculating the raw difference, the
+    # reference and probe frames are kept for the frames already
+    # selected, and for the frames with the highest difference so far.
+    # The kept frames of the final selection are then stored in
+    # `metric_kept_frames` for metric calculation.
+    # Without it, or with a downscaled comparison, only the difference
+    # itself is requested here, and the frames finally selected are
+    # requested again for metric calculation.
+    metric_kept_frames = {}
+    def metric_probing_diff(scene_n, zone_scene, probing_file, selected_frames, keep_frames):
+        if zone_scene["zone"].metric_highest_probing_diff_downscale > 1:
+            reference = zone_scene["zone"].metric_reference[zone_scene["start_frame"]:zone_scene["end_frame"]]
+            probe = zone_default.source_provider(probing_file)
+            width = max(math.ceil(reference.width / zone_scene["zone"].metric_highest_probing_diff_downscale / 2) * 2, 2)
+            height = max(math.ceil(reference.height / zone_scene["zone"].metric_highest_probing_diff_downscale / 2) * 2, 2)
+            clip = core.std.PlaneStats(reference.std.ShufflePlanes(planes=0, colorfamily=vs.GRAY).resize.Bilinear(width=width, height=height, format=vs.GRAYS),
+                                       probe.std.ShufflePlanes(planes=0, colorfamily=vs.GRAY).resize.Bilinear(width=width, height=height, format=vs.GRAYS),
+                                       prop="Encode")
+            keep_frames = False
+        else:
+            reference = metric_get_reference(zone_scene["zone"])[zone_scene["start_frame"]:zone_scene["end_frame"]]
+            probe = zone_scene["zone"].metric_process(zone_default.source_provider(probing_file))
+            clip = core.std.PlaneStats(reference, probe, prop="Encode")
+
+        encode_diffs = np.empty((clip.num_frames,), dtype=np.float64)
+        kept_frames = {}
+        kept_highest = []
+        requests = deque()
+        for frame in range(clip.num_frames):
+            if keep_frames:
+                requests.append((frame, clip.get_frame_async(frame), reference.get_frame_async(frame), probe.get_frame_async(frame)))
+            else:
+                requests.append((frame, clip.get_frame_async(frame), None, None))
+            while len(requests) > 48 or (frame == clip.num_frames - 1 and requests):
+                requested_frame, diff_frame, reference_frame, probe_frame = requests.popleft()
+                encode_diffs[requested_frame] = diff_frame.result().props["EncodeDiff"]
+                if not keep_frames:
+                    continue
+                if requested_frame in selected_frames:
+                    kept_frames[requested_frame] = (reference_frame.result(), probe_frame.result())
+                else:
+                    heapq.heappush(kept_highest, (encode_diffs[requested_frame], requested_frame))
+                    kept_frames[requested_frame] = (reference_frame.result(), probe_frame.result())
+                    if len(kept_highest) > zone_scene["zone"].metric_highest_probing_diff_frames:
+                        del kept_frames[heapq.heappop(kept_highest)[1]]
 
-            if zone_scene["zone"] not in metric_processed_reference:
-                metric_processed_reference[zone_scene["zone"]] = zone_scene["zone"].metric_process(zone_scene["zone"].metric_reference)
-            if zone_scene["zone"] not in metric_processed_first:
-                metric_processed_first[zone_scene["zone"]] = zone_scene["zone"].metric_process(metric_first)
-                
-            reference_offset = zone_scene["start_frame"] - probing_frame_head
+        return encode_diffs, kept_frames
 
+    # `probing_file` is the output of the probe encode for this scene only,
+    # starting from the first frame of the scene.
+    def metric_select_frames(scene_n, zone_scene, probing_file):
+        # SciPy is only imported once there are frames left to select, and
+        # not when resuming after frame selection has finished.
+        from scipy import fftpack, signal
 
-            if "frames" not in metric_result["scenes"][scene_n]:
-                if verbose >= 3:
-                    print(f"\r\033[K{scene_frame_print(scene_n)} / Frame selection", end="", flush=True)
+        if verbose >= 3:
+            print(f"\r\033[K{scene_frame_print(scene_n)} / Frame selection", end="", flush=True)
 
-                if zone_scene["end_frame"] - zone_scene["start_frame"] > 1:
-                    rng = default_rng(1188246) # Guess what is this number. It's the easiest cipher out there.
-                
-                    # These frames are offset from `scene["start_frame"] + 1` and that's why they are offfset, not offset
-                    offfset_frames = np.array([], dtype=np.int32)
-                    
-                    scene_diffs = scene_detection_diffs[zone_scene["start_frame"] + 1:zone_scene["end_frame"]]
+        if zone_scene["end_frame"] - zone_scene["start_frame"] > 1:
+            rng = default_rng(1188246) # Guess what is this number. It's the easiest cipher out there.
+        
+            # These frames are offset from `scene["start_frame"] + 1` and that's why they are offfset, not offset
+            offfset_frames = np.array([], dtype=np.int32)
+            
+            scene_diffs = scene_detection_diffs[zone_scene["start_frame"] + 1:zone_scene["end_frame"]]
     
-                    transform = fftpack.dct(scene_diffs)
-                    transform[np.max([math.ceil(transform.shape[0] / 5), 7]):] = 0
-                    reconstructed = fftpack.idct(transform)
+            transform = fftpack.dct(scene_diffs)
+            transform[np.max([math.ceil(transform.shape[0] / 5), 7]):] = 0
+            reconstructed = fftpack.idct(transform)
     
-                    peaks, properties = signal.find_peaks(reconstructed, prominence=0)
-                    peaks_sort = peaks[np.argsort(properties["prominences"])[::-1]]
+            peaks, properties = signal.find_peaks(reconstructed, prominence=0)
+            peaks_sort = peaks[np.argsort(properties["prominences"])[::-1]]
     
-                    picked = 0
-                    if verbose >= 3:
-                        print(f" / peak transformed", end="", flush=True)
-                    for offfset_frame in peaks_sort:
-                        if picked >= zone_scene["zone"].metric_peak_transformed_diff_frames:
-                            break
-                        offfset_frames = np.append(offfset_frames, offfset_frame)
-                        picked += 1
-                        if verbose >= 3:
-                            print(f" {zone_scene["start_frame"] + 1 + offfset_frame}", end="", flush=True)
+            picked = 0
+            if verbose >= 3:
+                print(f" / peak transformed", end="", flush=True)
+            for offfset_frame in peaks_sort:
+                if picked >= zone_scene["zone"].metric_peak_transformed_diff_frames:
+                    break
+                offfset_frames = np.append(offfset_frames, offfset_frame)
+                picked += 1
+                if verbose >= 3:
+                    print(f" {zone_scene["start_frame"] + 1 + offfset_frame}", end="", flush=True)
     
-                    scene_diffs_sort = np.argsort(scene_diffs)[::-1]
+            scene_diffs_sort = np.argsort(scene_diffs)[::-1]
     
-                    picked = 0
-                    if verbose >= 3:
-                        print(f" / highest diff", end="", flush=True)
-                    for offfset_frame in scene_diffs_sort:
-                        if picked >= zone_scene["zone"].metric_highest_diff_frames:
-                            break
-                        if offfset_frame in offfset_frames:
-                            continue
-                        offfset_frames = np.append(offfset_frames, offfset_frame)
-                        picked += 1
-                        if verbose >= 3:
-                            print(f" {zone_scene["start_frame"] + 1 + offfset_frame}", end="", flush=True)
+            picked = 0
+            if verbose >= 3:
+                print(f" / highest diff", end="", flush=True)
+            for offfset_frame in scene_diffs_sort:
+                if picked >= zone_scene["zone"].metric_highest_diff_frames:
+                    break
+                if offfset_frame in offfset_frames:
+                    continue
+                offfset_frames = np.append(offfset_frames, offfset_frame)
+                picked += 1
+                if verbose >= 3:
+                    print(f" {zone_scene["start_frame"] + 1 + offfset_frame}", end="", flush=True)
     
-                    if zone_scene["zone"].metric_highest_probing_diff_frames:
-                        if (zone_scene["zone"], reference_offset) not in metric_diff_clips:
-                            metric_diff_clips[(zone_scene["zone"], reference_offset)] = core.std.PlaneStats(metric_processed_reference[zone_scene["zone"]][reference_offset:],
-                                                                                                            metric_processed_first[zone_scene["zone"]],
-                                                                                                            prop="Encode")
-                        clip = metric_diff_clips[(zone_scene["zone"], reference_offset)][probing_frame_head:probing_frame_head + zone_scene["end_frame"] - zone_scene["start_frame"]]
-                        encode_diffs = [frame.props["EncodeDiff"] for frame in clip.frames(backlog=48)]
-                        encode_diffs_sort = np.argsort(encode_diffs, stable=True)[::-1]
-                        picked = 0
-                        if verbose >= 3:
-                            print(f" / highest probing diff", end="", flush=True)
-                        for frame in encode_diffs_sort:
-                            if picked >= zone_scene["zone"].metric_highest_probing_diff_frames:
-                                break
-                            if frame - 1 in offfset_frames:
-                                continue
-                            offfset_frames = np.append(offfset_frames, frame - 1)
-                            picked += 1
-                            if verbose >= 3:
-                                print(f" {zone_scene["start_frame"] + frame}", end="", flush=True)
-                    
-                    if verbose >= 3:
-                        print(f" / last", end="", flush=True)
-                    if zone_scene["zone"].metric_last_frame >= 1 and zone_scene["end_frame"] - zone_scene["start_frame"] - 2 not in offfset_frames:
-                        offfset_frames = np.append(offfset_frames, zone_scene["end_frame"] - zone_scene["start_frame"] - 2)
-                        if verbose >= 3:
-                            print(f" {zone_scene["end_frame"] - 1}", end="", flush=True)
-                
-                    scene_diffs_percentile = np.percentile(scene_diffs, 40, method="linear")
-                    scene_diffs_percentile_absolute_deviation = np.percentile(np.abs(scene_diffs - scene_diffs_percentile), 40, method="linear")
-                    scene_diffs_upper_bracket_ = np.argwhere(scene_diffs > scene_diffs_percentile + 5 * scene_diffs_percentile_absolute_deviation).reshape((-1))
-                    scene_diffs_lower_bracket_ = np.argwhere(scene_diffs <= scene_diffs_percentile + 5 * scene_diffs_percentile_absolute_deviation).reshape((-1))
-                    scene_diffs_upper_bracket = np.empty_like(scene_diffs_upper_bracket_)
-                    rng.shuffle((scene_diffs_upper_bracket__ := scene_diffs_upper_bracket_[:math.ceil(scene_diffs_upper_bracket_.shape[0] / 2)]))
-                    scene_diffs_upper_bracket[::2] = scene_diffs_upper_bracket__
-                    rng.shuffle((scene_diffs_upper_bracket__ := scene_diffs_upper_bracket_[-math.floor(scene_diffs_upper_bracket_.shape[0] / 2):]))
-                    scene_diffs_upper_bracket[1::2] = scene_diffs_upper_bracket__
-                    scene_diffs_lower_bracket = np.empty_like(scene_diffs_lower_bracket_)
-                    rng.shuffle((scene_diffs_lower_bracket__ := scene_diffs_lower_bracket_[:math.ceil(scene_diffs_lower_bracket_.shape[0] / 2)]))
-                    scene_diffs_lower_bracket[::2] = scene_diffs_lower_bracket__
-                    rng.shuffle((scene_diffs_lower_bracket__ := scene_diffs_lower_bracket_[-math.floor(scene_diffs_lower_bracket_.shape[0] / 2):]))
-                    scene_diffs_lower_bracket[1::2] = scene_diffs_lower_bracket__
-                
-                    picked = 0
-                    if verbose >= 3:
-                        print(f" / upper bracket", end="", flush=True)
-                    for offfset_frame in scene_diffs_upper_bracket:
-                        if picked >= zone_scene["zone"].metric_upper_diff_bracket_frames:
-                            break
-                        if offfset_frames.shape[0] != 0 and np.min(np.abs(offfset_frames - offfset_frame)) < zone_scene["zone"].metric_diff_brackets_min_separation:
-                            continue
-                        offfset_frames = np.append(offfset_frames, offfset_frame)
-                        picked += 1
-                        if verbose >= 3:
-                            print(f" {zone_scene["start_frame"] + 1 + offfset_frame}", end="", flush=True)
-                    
-                    if picked < zone_scene["zone"].metric_upper_diff_bracket_fallback_frames:
-                        to_pick = zone_scene["zone"].metric_lower_diff_bracket_frames + zone_scene["zone"].metric_upper_diff_bracket_fallback_frames - picked
-                    else:
-                        to_pick = zone_scene["zone"].metric_lower_diff_bracket_frames
-                
-                    if verbose >= 3:
-                        print(f" / first", end="", flush=True)
-                    if zone_scene["zone"].metric_first_frame >= 1 and -1 not in offfset_frames:
-                        offfset_frames = np.append(offfset_frames, -1)
-                        if verbose >= 3:
-                            print(f" {zone_scene["start_frame"]}", end="", flush=True)
-                
-                    picked = 0
+            if zone_scene["zone"].metric_highest_probing_diff_frames and not zone_scene["zone"].metric_highest_probing_diff_after_brackets:
+                encode_diffs, _ = metric_probing_diff(scene_n, zone_scene, probing_file, offfset_frames + 1, False)
+                encode_diffs_sort = np.argsort(encode_diffs, stable=True)[::-1]
+                picked = 0
+                if verbose >= 3:
+                    print(f" / highest probing diff", end="", flush=True)
+                for frame in encode_diffs_sort:
+                    if picked >= zone_scene["zone"].metric_highest_probing_diff_frames:
+                        break
+                    if frame - 1 in offfset_frames:
+                        continue
+                    offfset_frames = np.append(offfset_frames, frame - 1)
+                    picked += 1
                     if verbose >= 3:
-                        print(f" / lower bracket", end="", flush=True)
-                    for offfset_frame in scene_diffs_lower_bracket:
-                        if picked >= to_pick:
-                            break
-                        if offfset_frames.shape[0] != 0 and np.min(np.abs(offfset_frames - offfset_frame)) < zone_scene["zone"].metric_diff_brackets_min_separation:
-                            continue
-                        offfset_frames = np.append(offfset_frames, offfset_frame)
-                        picked += 1
-                        if verbose >= 3:
-                            print(f" {zone_scene["start_frame"] + 1 + offfset_frame}", end="", flush=True)
+                        print(f" {zone_scene["start_frame"] + frame}", end="", flush=True)
     
+            if verbose >= 3:
+                print(f" / last", end="", flush=True)
+            if zone_scene["zone"].metric_last_frame >= 1 and zone_scene["end_frame"] - zone_scene["start_frame"] - 2 not in offfset_frames:
+                offfset_frames = np.append(offfset_frames, zone_scene["end_frame"] - zone_scene["start_frame"] - 2)
+                if verbose >= 3:
+                    print(f" {zone_scene["end_frame"] - 1}", end="", flush=True)
+        
+            scene_diffs_percentile = np.percentile(scene_diffs, 40, method="linear")
+            scene_diffs_percentile_absolute_deviation = np.percentile(np.abs(scene_diffs - scene_diffs_percentile), 40, method="linear")
+            scene_diffs_upper_bracket_ = np.argwhere(scene_diffs > scene_diffs_percentile + 5 * scene_diffs_percentile_absolute_deviation).reshape((-1))
+            scene_diffs_lower_bracket_ = np.argwhere(scene_diffs <= scene_diffs_percentile + 5 * scene_diffs_percentile_absolute_deviation).reshape((-1))
+            scene_diffs_upper_bracket = np.empty_like(scene_diffs_upper_bracket_)
+            rng.shuffle((scene_diffs_upper_bracket__ := scene_diffs_upper_bracket_[:math.ceil(scene_diffs_upper_bracket_.shape[0] / 2)]))
+            scene_diffs_upper_bracket[::2] = scene_diffs_upper_bracket__
+            rng.shuffle((scene_diffs_upper_bracket__ := scene_diffs_upper_bracket_[-math.floor(scene_diffs_upper_bracket_.shape[0] / 2):]))
+            scene_diffs_upper_bracket[1::2] = scene_diffs_upper_bracket__
+            scene_diffs_lower_bracket = np.empty_like(scene_diffs_lower_bracket_)
+            rng.shuffle((scene_diffs_lower_bracket__ := scene_diffs_lower_bracket_[:math.ceil(scene_diffs_lower_bracket_.shape[0] / 2)]))
+            scene_diffs_lower_bracket[::2] = scene_diffs_lower_bracket__
+            rng.shuffle((scene_diffs_lower_bracket__ := scene_diffs_lower_bracket_[-math.floor(scene_diffs_lower_bracket_.shape[0] / 2):]))
+            scene_diffs_lower_bracket[1::2] = scene_diffs_lower_bracket__
+        
+            picked = 0
+            if verbose >= 3:
+                print(f" / upper bracket", end="", flush=True)
+            for offfset_frame in scene_diffs_upper_bracket:
+                if picked >= zone_scene["zone"].metric_upper_diff_bracket_frames:
+                    break
+                if offfset_frames.shape[0] != 0 and np.min(np.abs(offfset_frames - offfset_frame)) < zone_scene["zone"].metric_diff_brackets_min_separation:
+                    continue
+                offfset_frames = np.append(offfset_frames, offfset_frame)
+                picked += 1
+                if verbose >= 3:
+                    print(f" {zone_scene["start_frame"] + 1 + offfset_frame}", end="", flush=True)
+            
+            if picked < zone_scene["zone"].metric_upper_diff_bracket_fallback_frames:
+                to_pick = zone_scene["zone"].metric_lower_diff_bracket_frames + zone_scene["zone"].metric_upper_diff_bracket_fallback_frames - picked
+            else:
+                to_pick = zone_scene["zone"].metric_lower_diff_bracket_frames
+        
+            if verbose >= 3:
+                print(f" / first", end="", flush=True)
+            if zone_scene["zone"].metric_first_frame >= 1 and -1 not in offfset_frames:
+                offfset_frames = np.append(offfset_frames, -1)
+                if verbose >= 3:
+                    print(f" {zone_scene["start_frame"]}", end="", flush=True)
+        
+            picked = 0
+            if verbose >= 3:
+                print(f" / lower bracket", end="", flush=True)
+            for offfset_frame in scene_diffs_lower_bracket:
+                if picked >= to_pick:
+                    break
+                if offfset_frames.shape[0] != 0 and np.min(np.abs(offfset_frames - offfset_frame)) < zone_scene["zone"].metric_diff_brackets_min_separation:
+                    continue
+                offfset_frames = np.append(offfset_frames, offfset_frame)
+                picked += 1
+                if verbose >= 3:
+                    print(f" {zone_scene["start_frame"] + 1 + offfset_frame}", end="", flush=True)
+    
+            if zone_scene["zone"].metric_highest_probing_diff_frames and zone_scene["zone"].metric_highest_probing_diff_after_brackets:
+                encode_diffs, kept_frames = metric_probing_diff(scene_n, zone_scene, probing_file, offfset_frames + 1, zone_scene["zone"].metric_method == "vapoursynth")
+                encode_diffs_sort = np.argsort(encode_diffs, stable=True)[::-1]
+                picked = 0
+                if verbose >= 3:
+                    print(f" / highest probing diff", end="", flush=True)
+                for frame in encode_diffs_sort:
+                    if picked >= zone_scene["zone"].metric_highest_probing_diff_frames:
+                        break
+                    if frame - 1 in offfset_frames:
+                        continue
+                    offfset_frames = np.append(offfset_frames, frame - 1)
+                    picked += 1
                     if verbose >= 3:
-                        print(f"", end="\n", flush=True)
-                        
-                    metric_result["scenes"][scene_n]["frames"] = np.sort(offfset_frames) + 1
-
-                else:
-                    if verbose >= 3:
-                        print(f" / frame {zone_scene["start_frame"]}", end="\n", flush=True)
-                    metric_result["scenes"][scene_n]["frames"] = np.array([0], dtype=np.int32)
-
+                        print(f" {zone_scene["start_frame"] + frame}", end="", flush=True)
 
-            if "first_score" not in metric_result["scenes"][scene_n]:
-                if zone_scene["zone"].metric_method == "vapoursynth":
-                    if (zone_scene["zone"], reference_offset) not in metric_first_metric_clips:
-                        metric_first_metric_clips[(zone_scene["zone"], reference_offset)] = zone_scene["zone"].metric_vapoursynth_calculate(metric_processed_reference[zone_scene["zone"]][reference_offset:], metric_processed_first[zone_scene["zone"]])
-        
-                    clip = metric_first_metric_clips[(zone_scene["zone"], reference_offset)][int(metric_result["scenes"][scene_n]["frames"][0] + probing_frame_head)]
-                    for frame in metric_result["scenes"][scene_n]["frames"][1:]:
-                        clip += metric_first_metric_clips[(zone_scene["zone"], reference_offset)][int(frame + probing_frame_head)]
-
-                    scores = np.array([zone_scene["zone"].metric_vapoursynth_metric(frame) for frame in clip.frames(backlog=48)])
-                    
-                elif zone_scene["zone"].metric_method == "ffvship":
-                    metric_ffvship_output_file.unlink(missing_ok=True)
-
-                    command = [
-                        "FFVship",
-                        "--source", input_file,
-                        "--encoded", probing_first_output_file,
-                        "--cache-index",
-                        "--source-index", metric_ffvship_source_cache,
-                        "--encoded-index", metric_ffvship_first_cache,
-                        "--metric", zone_scene["zone"].metric_ffvship_calculate
-                    ]
-                    if zone_scene["zone"].metric_ffvship_calculate == "Butteraugli" and zone_scene["zone"].metric_ffvship_intensity_target is not None:
-                        command += ["--intensity-target", str(zone_scene["zone"].metric_ffvship_intensity_target)]
-                    command += [
-                        "--json", metric_ffvship_output_file,
-                        "--source-indices", ",".join([str(frame) for frame in (metric_result["scenes"][scene_n]["frames"] + zone_scene["start_frame"])]),
-                        "--encoded-offset", str(-reference_offset),
-                        *zone_scene["zone"].metric_ffvship_extra_parameters
-                    ]
-                    subprocess.run(command, text=True, stdout=subprocess.DEVNULL)
-                    assert metric_ffvship_output_file.exists()
-
-                    with metric_ffvship_output_file.open("r") as metric_output_f:
-                        scores = json.load(metric_output_f)
-                    scores = np.array([zone_scene["zone"].metric_ffvship_metric(frame) for frame in scores])
+                if zone_scene["zone"].metric_method == "vapoursynth" and all(frame + 1 in kept_frames for frame in offfset_frames):
+                    metric_kept_frames[scene_n] = [kept_frames[frame + 1] for frame in np.sort(offfset_frames)]
+    
+            if verbose >= 3:
+                print(f"", end="\n", flush=True)
                 
-                metric_result["scenes"][scene_n]["first_score"] = zone_scene["zone"].metric_summarise(np.array(metric_result["scenes"][scene_n]["frames"]), scores)
-
+            return np.sort(offfset_frames) + 1
 
-            probing_frame_head += zone_scene["end_frame"] - zone_scene["start_frame"]
-
-            with metric_result_file.open("w") as metric_result_f:
-                json.dump(metric_result, metric_result_f, cls=NumpyEncoder)
+        else:
+            if verbose >= 3:
+                print(f" / frame {zone_scene["start_frame"]}", end="\n", flush=True)
+            return np.array([0], dtype=np.int32)
+
+    # Raw per-frame metric results are cached in `metric-cache` folder,
+    # one file for every probe encode, named after the hash of the probe
+    # encode itself. For VapourSynth based metric, the numeric frame props
+    # of the metric output are cached, and for FFVship, the raw result of
+    # each frame. `metric_vapoursynth_metric`, `metric_ffvship_metric` and
+    # `metric_summarise` are always applied on the cached results, so
+    # changing any of them only needs the cached results to be summarised
+    # again, and only the frames missing from the cache are calculated.
+    # The cache of a probe encode is discarded once the metric,
+    # `metric_process` or `metric_cache_version` is changed.
+    metric_cache_dir = progression_boost_temp_dir / "metric-cache"
+    metric_cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def metric_cache_load(zone_scene, probing_file):
+        if zone_scene["zone"].metric_method == "vapoursynth":
+            settings = ["vapoursynth", function_cache_key(zone_scene["zone"].metric_vapoursynth_calculate), function_cache_key(zone_scene["zone"].metric_process)]
+        else:
+            settings = ["ffvship", zone_scene["zone"].metric_ffvship_calculate, zone_scene["zone"].metric_ffvship_intensity_target]
+        settings.append(zone_scene["zone"].metric_cache_version)
+
+        metric_cache = {
+            "file": metric_cache_dir / f"{hashlib.blake2b(probing_file.read_bytes(), digest_size=16).hexdigest()}.json",
+            "settings": settings,
+            "frames": {}
+        }
+        if metric_cache["file"].exists():
+            try:
+                with metric_cache["file"].open("r") as metric_cache_f:
+                    cached = json.load(metric_cache_f)
+            # Cache files from earlier versions were written in place and
+            # may have been cut off when the script was interrupted.
+            except json.JSONDecodeError:
+                cached = None
+            if cached is not None and cached["settings"] == json.loads(json.dumps(settings, cls=NumpyEncoder)):
+                metric_cache["frames"] = {int(frame): result for frame, result in cached["frames"].items()}
+        return metric_cache
+
+    def metric_cache_summarise(probing_round, scene_n, metric_cache):
+        metric_cache_temp_file = metric_cache["file"].with_name(metric_cache["file"].name + ".tmp")
+        with metric_cache_temp_file.open("w") as metric_cache_f:
+            json.dump({ "settings": metric_cache["settings"], "frames": metric_cache["frames"] }, metric_cache_f, cls=NumpyEncoder)
+        os.replace(metric_cache_temp_file, metric_cache["file"])
+
+        zone_scene = zone_scenes["scenes"][scene_n]
+        if zone_scene["zone"].metric_method == "vapoursynth":
+            scores = np.array([zone_scene["zone"].metric_vapoursynth_metric(SimpleNamespace(props=metric_cache["frames"][int(frame)])) for frame in metric_result["scenes"][scene_n]["frames"]])
+        else:
+            scores = np.array([zone_scene["zone"].metric_ffvship_metric(metric_cache["frames"][int(frame)]) for frame in metric_result["scenes"][scene_n]["frames"]])
+        metric_finish(probing_round, scene_n, zone_scene["zone"].metric_summarise(np.array(metric_result["scenes"][scene_n]["frames"]), scores))
+
+    # Frames for VapourSynth based metric are requested from
+    # `metric_stream` with up to `metric_vapoursynth_prefetch` requests in
+    # flight at the same time. The results are collected back into
+    # `metric_streaming` for each scene, and a scene is summarised as soon
+    # as all its frames have arrived.
+    metric_stream = deque()
+    metric_requests = []
+    metric_streaming = {}
+
+    def metric_vapoursynth_launch(probing_round, scene_n, zone_scene, probing_file, metric_cache, missing_frames):
+        if probing_round == "first" and scene_n in metric_kept_frames:
+            kept_frames = metric_kept_frames.pop(scene_n)
+            reference = core.std.BlankClip(width=kept_frames[0][0].width, height=kept_frames[0][0].height, format=kept_frames[0][0].format.id, length=len(kept_frames), keep=True)
+            reference = reference.std.ModifyFrame(reference, lambda n, f: kept_frames[n][0])
+            probe = core.std.BlankClip(width=kept_frames[0][1].width, height=kept_frames[0][1].height, format=kept_frames[0][1].format.id, length=len(kept_frames), keep=True)
+            probe = probe.std.ModifyFrame(probe, lambda n, f: kept_frames[n][1])
+            metric_clip = zone_scene["zone"].metric_vapoursynth_calculate(reference, probe)
+            metric_frames = [list(metric_result["scenes"][scene_n]["frames"]).index(frame) for frame in missing_frames]
+        else:
+            metric_clip = zone_scene["zone"].metric_vapoursynth_calculate(metric_get_reference(zone_scene["zone"])[zone_scene["start_frame"]:zone_scene["end_frame"]],
+                                                                          zone_scene["zone"].metric_process(zone_default.source_provider(probing_file)))
+            metric_frames = missing_frames
+
+        metric_streaming[(probing_round, scene_n)] = {
+            "clip": metric_clip,
+            "cache": metric_cache,
+            "frames": missing_frames,
+            "remaining": len(missing_frames)
+        }
+        for i, frame in enumerate(metric_frames):
+            metric_stream.append((probing_round, scene_n, i, int(frame)))
+
+    def metric_vapoursynth_collect():
+        metric_collected = []
+        for request in metric_requests:
+            probing_round, scene_n, i, frame = request
+            if frame.done():
+                metric_scene = metric_streaming[(probing_round, scene_n)]
+                metric_scene["cache"]["frames"][metric_scene["frames"][i]] = {key: value for key, value in frame.result().props.items() if isinstance(value, (int, float))}
+                metric_scene["remaining"] -= 1
+                metric_collected.append(request)
+        for request in metric_collected:
+            metric_requests.remove(request)
+
+        while len(metric_requests) < zone_default.metric_vapoursynth_prefetch and metric_stream:
+            probing_round, scene_n, i, frame = metric_stream.popleft()
+            metric_requests.append((probing_round, scene_n, i, metric_streaming[(probing_round, scene_n)]["clip"].get_frame_async(frame)))
+
+        for (probing_round, scene_n), metric_scene in list(metric_streaming.items()):
+            if metric_scene["remaining"] == 0:
+                del metric_streaming[(probing_round, scene_n)]
+                metric_cache_summarise(probing_round, scene_n, metric_scene["cache"])
+
+    # FFVship can only be given one encoded file at a time, and every
+    # scene's probe encode is a separate file. Instead of waiting for each
+    # FFVship process to finish, they are launched in the background and
+    # collected once they finish.
+    def metric_ffvship_launch(probing_round, scene_n, zone_scene, probing_file, metric_cache, missing_frames):
+        metric_ffvship_output_file = metric_ffvship_output_dir / f"{probing_round}-{probing_chunks[scene_n]}.json"
+        metric_ffvship_output_file.unlink(missing_ok=True)
 
-    if start_count != -1:
-        print(f"\r\033[K{scene_frame_print(scene_n)} / Metric calculation complete / {(start_count + 1) / (time.time() - start):.2f} scenes per second", end="\n", flush=True)
+        command = [
+            "FFVship",
+            "--source", input_file,
+            "--encoded", probing_file,
+            "--cache-index",
+            "--source-index", metric_ffvship_source_cache,
+            "--encoded-index", probing_file.with_suffix(".ffvship.ffindex"),
+            "--metric", zone_scene["zone"].metric_ffvship_calculate
+        ]
+        if zone_scene["zone"].metric_ffvship_calculate == "Butteraugli" and zone_scene["zone"].metric_ffvship_intensity_target is not None:
+            command += ["--intensity-target", str(zone_scene["zone"].metric_ffvship_intensity_target)]
+        command += [
+            "--json", metric_ffvship_output_file,
+            "--source-indices", ",".join([str(frame + zone_scene["start_frame"]) for frame in missing_frames]),
+            "--encoded-offset", str(-zone_scene["start_frame"]),
+            *zone_scene["zone"].metric_ffvship_extra_parameters
+        ]
+        return subprocess.Popen(command, text=True, stdout=subprocess.DEVNULL), metric_ffvship_output_file, metric_cache, missing_frames
 
+    def metric_ffvship_collect(probing_round, scene_n, metric_ffvship_process, metric_ffvship_output_file, metric_cache, missing_frames):
+        assert metric_ffvship_process.returncode == 0 and metric_ffvship_output_file.exists(), f"Unexpected result from FFVship for {scene_frame_print(scene_n)}."
+        if not metric_ffvship_source_cache_done.exists():
+            metric_ffvship_source_cache_done.touch()
 
-#  ██████╗ ██████╗  ██████╗ ██████╗ ██╗███╗   ██╗ ██████╗       ███████╗███████╗ ██████╗ ██████╗ ███╗   ██╗██████╗ 
-#  ██╔══██╗██╔══██╗██╔═══██╗██╔══██╗██║████╗  ██║██╔════╝       ██╔════╝██╔════╝██╔════╝██╔═══██╗████╗  ██║██╔══██╗
-#  ██████╔╝██████╔╝██║   ██║██████╔╝██║██╔██╗ ██║██║  ███╗█████╗███████╗█████╗  ██║     ██║   ██║██╔██╗ ██║██║  ██║
-#  ██╔═══╝ ██╔══██╗██║   ██║██╔══██╗██║██║╚██╗██║██║   ██║╚════╝╚════██║██╔══╝  ██║     ██║   ██║██║╚██╗██║██║  ██║
-#  ██║     ██║  ██║╚██████╔╝██████╔╝██║██║ ╚████║╚██████╔╝      ███████║███████╗╚██████╗╚██████╔╝██║ ╚████║██████╔╝
-#  ╚═╝     ╚═╝  ╚═╝ ╚═════╝ ╚═════╝ ╚═╝╚═╝  ╚═══╝ ╚═════╝       ╚══════╝╚══════╝ ╚═════╝ ╚═════╝ ╚═╝  ╚═══╝╚═════╝ 
+        with metric_ffvship_output_file.open("r") as metric_output_f:
+            results = json.load(metric_output_f)
+        assert len(results) == len(missing_frames), f"Unexpected result from FFVship for {scene_frame_print(scene_n)}."
+        for frame, result in zip(missing_frames, results):
+            metric_cache["frames"][frame] = result
+        metric_ffvship_output_file.unlink()
 
+        metric_cache_summarise(probing_round, scene_n, metric_cache)
 
-if metric_has_metric and probing_second_perform_encode:
-    probing_second_scenes = {}
-    probing_second_scenes["scenes"] = []
-    total_frames = 0
-    for scene_n, zone_scene in enumerate(zone_scenes["scenes"]):
-        if zone_scene["zone"].metric_enable:
-            if zone_scene["zone"].metric_better(metric_result["scenes"][scene_n]["first_score"], zone_scene["zone"].metric_target):
-                metric_result["scenes"][scene_n]["second_qstep"] = 891
-            else:
-                metric_result["scenes"][scene_n]["second_qstep"] = 155
-
-            total_frames += zone_scene["end_frame"] - zone_scene["start_frame"]
-            probing_scene = {
-                "start_frame": zone_scene["start_frame"],
-                "end_frame": zone_scene["end_frame"],
-                "zone_overrides": copy.copy(zone_scene["zone_overrides"])
-            }
-            probing_scene["zone_overrides"]["encoder"] = zone_scene["zone"].probing_dynamic_encoder(zone_scene["start_frame"],
-                                                                                                    zone_scene["end_frame"],
-                                                                                                    scene_detection_average[zone_scene["start_frame"]:zone_scene["end_frame"]],
-                                                                                                    scene_detection_min[zone_scene["start_frame"]:zone_scene["end_frame"]],
-                                                                                                    scene_detection_max[zone_scene["start_frame"]:zone_scene["end_frame"]],
-                                                                                                    scene_detection_diffs[zone_scene["start_frame"]:zone_scene["end_frame"]])
-            if zone_scene["zone"].quarterstep_crf:
-                probing_scene["zone_overrides"]["video_params"] = [
-                    "--crf", f"{(np.searchsorted(dc, metric_result["scenes"][scene_n]["second_qstep"], side="right") - 1) / 4:.2f}"
-                ]
+    def probing_second_qstep(scene_n):
+        if zone_scenes["scenes"][scene_n]["zone"].metric_better(metric_result["scenes"][scene_n]["first_score"], zone_scenes["scenes"][scene_n]["zone"].metric_target):
+            return 891
+        else:
+            return 155
+
+    # Every scene goes through first probe, first metric, second probe
+    # and second metric on its own. Scenes waiting for a probe encode are
+    # kept in `probing_queue`, and scenes whose probe encode has finished
+    # are kept in `metric_queue`. Second probes are launched before first
+    # probes so that scenes already halfway through finish first, and
+    # longer scenes are launched before shorter scenes so that the last
+    # few probe encodes don't hold up everything else.
+    probing_queue = {"first": [], "second": []}
+    probing_running = {}
+    metric_queue = []
+    metric_running = {}
+    probing_finished = 0
+    for scene_n in probing_chunks:
+        metric_result["scenes"][scene_n]["first_qstep"] = 343
+
+        if not probing_chunk_done("first", scene_n) or probing_read_qstep("first", scene_n) != metric_result["scenes"][scene_n]["first_qstep"]:
+            for key in ["first_score", "second_qstep", "second_score"]:
+                if key in metric_result["scenes"][scene_n]:
+                    del metric_result["scenes"][scene_n][key]
+            probing_reset("second", scene_n)
+            probing_queue["first"].append(scene_n)
+        elif "first_score" not in metric_result["scenes"][scene_n]:
+            for key in ["second_qstep", "second_score"]:
+                if key in metric_result["scenes"][scene_n]:
+                    del metric_result["scenes"][scene_n][key]
+            metric_queue.append(("first", scene_n))
+        else:
+            if "second_qstep" not in metric_result["scenes"][scene_n]:
+                metric_result["scenes"][scene_n]["second_qstep"] = probing_second_qstep(scene_n)
+            if not probing_chunk_done("second", scene_n) or probing_read_qstep("second", scene_n) != metric_result["scenes"][scene_n]["second_qstep"]:
+                if "second_score" in metric_result["scenes"][scene_n]:
+                    del metric_result["scenes"][scene_n]["second_score"]
+                probing_queue["second"].append(scene_n)
+            elif "second_score" not in metric_result["scenes"][scene_n]:
+                metric_queue.append(("second", scene_n))
             else:
-                probing_scene["zone_overrides"]["video_params"] = [
-                    "--crf", f"{(np.searchsorted(dc, metric_result["scenes"][scene_n]["second_qstep"], side="right") - 1) / 4:.0f}"
-                ]
-            probing_scene["zone_overrides"]["video_params"] += [
-                "--preset", f"{zone_scene["zone"].probing_preset}",
-                *zone_scene["zone"].probing_dynamic_parameters(zone_scene["start_frame"],
-                                                               zone_scene["end_frame"],
-                                                               (np.searchsorted(dc, metric_result["scenes"][scene_n]["second_qstep"], side="right") - 1) / 4,
-                                                               scene_detection_average[zone_scene["start_frame"]:zone_scene["end_frame"]],
-                                                               scene_detection_min[zone_scene["start_frame"]:zone_scene["end_frame"]],
-                                                               scene_detection_max[zone_scene["start_frame"]:zone_scene["end_frame"]],
-                                                               scene_detection_diffs[zone_scene["start_frame"]:zone_scene["end_frame"]])
-            ]
-            probing_scene["zone_overrides"]["photon_noise"] = None
-            probing_scene["zone_overrides"]["photon_noise_height"] = None
-            probing_scene["zone_overrides"]["photon_noise_width"] = None
-            probing_scene["zone_overrides"]["chroma_noise"] = False
-            probing_second_scenes["scenes"].append(probing_scene)
-    probing_second_scenes["frames"] = total_frames
-    probing_second_scenes["split_scenes"] = probing_second_scenes["scenes"]
-
-    with metric_result_file.open("w") as metric_result_f:
-        json.dump(metric_result, metric_result_f, cls=NumpyEncoder)
-            
-    with probing_second_scenes_file.open("w") as probing_scenes_f:
-        json.dump(probing_second_scenes, probing_scenes_f, cls=NumpyEncoder)
-
-    probing_second_process = probing_perform_probing(probing_second_tmp_dir, probing_second_scenes_file, probing_second_output_file, probing_second_output_file_cache)
+                probing_finished += 1
 
-    if verbose < 2:
-        probing_second_start = time.time() - 0.000001
-        probing_second_done_scenes_len_start = 0
-        if probing_second_done_file.exists():
-            with probing_second_done_file.open("r") as done_f:
-                done_scenes = None
-                try:
-                    done_scenes = json.load(done_f)
-                except json.JSONDecodeError:
-                    pass
-                    
-                if done_scenes is not None and "done" in done_scenes:
-                    probing_second_done_scenes_len_start = len(done_scenes["done"])
+    metric_result_journal.save(metric_result)
 
+    def metric_finish(probing_round, scene_n, score):
+        global probing_finished
+        metric_result["scenes"][scene_n][f"{probing_round}_score"] = score
+        if probing_round == "first":
+            metric_result["scenes"][scene_n]["second_qstep"] = probing_second_qstep(scene_n)
+            if probing_chunk_done("second", scene_n) and probing_read_qstep("second", scene_n) == metric_result["scenes"][scene_n]["second_qstep"]:
+                metric_queue.append(("second", scene_n))
+            else:
+                probing_queue["second"].append(scene_n)
+        else:
+            probing_finished += 1
+
+        metric_result_journal.update(metric_result, scene_n)
+
+    # Scenes are only added to `metric_stream` when it's running low, so
+    # that not too many probe encodes are opened at the same time.
+    # Only one FFVship process is allowed to run until the first FFVship
+    # process has exited successfully and the source index is complete, so
+    # that they don't all index the source at once, or read an index that
+    # is still being written.
+    def metric_ready(probing_round, scene_n):
+        if zone_scenes["scenes"][scene_n]["zone"].metric_method != "ffvship":
+            return len(metric_stream) < zone_default.metric_vapoursynth_prefetch
+        if metric_ffvship_source_cache_done.exists():
+            return len(metric_running) < zone_default.metric_ffvship_workers
+        return len(metric_running) < 1
 
-if character_has_character:
     start = time.time() - 0.000001
     start_count = -1
-    for scene_n in range(character_precalc, len(scenes["scenes"])):
-        if zone_scenes["scenes"][scene_n]["zone"].character_enable:
-            character_map_file = character_boost_temp_dir / f"character-{scene_rjust(scene_n)}.npy"
-            if not resume or not character_map_file.exists() or "kyara" not in character_kyara["scenes"][scene_n]:
-                start_count += 1
-                print(f"\r\033[K{scene_frame_print(scene_n)} / Performing character segmentation / {start_count / (time.time() - start):.2f} scenes per second", end="", flush=True)
-
-                character_calculate_character(character_map_file, scene_n)
-    else:
-        if start_count != -1:
-            if character_precalc == 0:
-                print(f"\r\033[K{scene_frame_print(scene_n)} / Character segmentation complete / {(start_count + 1) / (time.time() - start):.2f} scenes per second", end="\n", flush=True)
-            elif character_precalc != len(scenes["scenes"]):
-                print(f"\r\033[K{scene_frame_print(scene_n)} / Character segmentation complete", end="\n", flush=True)
-
-
-if metric_has_metric and probing_second_perform_encode:
-    if verbose < 2:
-        if probing_second_process.poll() is not None:
-            print(f"\r\033[KScene {scene_rjust(len(probing_second_scenes["scenes"]))}/{scene_rjust(len(probing_second_scenes["scenes"]))} / Second probe complete", end="\n", flush=True)
+    while probing_queue["first"] or probing_queue["second"] or probing_running or metric_queue or metric_running or metric_streaming:
+        metric_vapoursynth_collect()
+
+        for (probing_round, scene_n), metric_ffvship in list(metric_running.items()):
+            if metric_ffvship[0].poll() is not None:
+                del metric_running[(probing_round, scene_n)]
+                metric_ffvship_collect(probing_round, scene_n, *metric_ffvship)
+
+        for (probing_round, scene_n), (probing_process, probing_feeder) in list(probing_running.items()):
+            if probing_process.poll() is not None:
+                del probing_running[(probing_round, scene_n)]
+                probing_finish(probing_round, scene_n, probing_process, probing_feeder)
+                metric_queue.append((probing_round, scene_n))
+
+        while len(probing_running) < zone_default.probing_workers and (probing_queue["second"] or probing_queue["first"]):
+            probing_round = "second" if probing_queue["second"] else "first"
+            scene_n = max(probing_queue[probing_round], key=lambda scene_n: scenes["scenes"][scene_n]["end_frame"] - scenes["scenes"][scene_n]["start_frame"])
+            probing_queue[probing_round].remove(scene_n)
+            probing_running[(probing_round, scene_n)] = probing_launch(probing_round, scene_n)
+
+        for probing_round, scene_n in metric_queue:
+            if metric_ready(probing_round, scene_n):
+                break
         else:
-            while True:
-                if probing_second_process.poll() is not None:
-                    break
+            scene_n = None
 
-                if probing_second_done_file.exists():
-                    with probing_second_done_file.open("r") as done_f:
-                        done_scenes_len_previous = probing_second_done_scenes_len_start
-                        while True:
-                            if probing_second_process.poll() is not None:
-                                break
-
-                            done_scenes = None
-                            done_f.seek(0)
-                            try:
-                                done_scenes = json.load(done_f)
-                            except json.JSONDecodeError:
-                                time.sleep(1 / 6000 * 1001)
-                                continue
+        if scene_n is not None:
+            metric_queue.remove((probing_round, scene_n))
+            zone_scene = zone_scenes["scenes"][scene_n]
+            assert zone_scene["zone"].metric_method in ["ffvship", "vapoursynth"], "Invalid `metric_method`. Please check your config inside `Progression-Boost.py`."
 
-                            if done_scenes is not None and "done" in done_scenes:
-                                if (done_scenes_len := len(done_scenes["done"])) != done_scenes_len_previous or done_scenes_len == 0:
-                                    print(f"\r\033[KScene {scene_rjust(done_scenes_len)}/{scene_rjust(len(probing_second_scenes["scenes"]))} / Performing second probe / {(done_scenes_len - probing_second_done_scenes_len_start) / (time.time() - probing_second_start):.2f} scenes per second", end="", flush=True)
-                                    done_scenes_len_previous = done_scenes_len
+            probing_file = probing_chunk_file(probing_round, scene_n)
 
-                            time.sleep(1 / 6000 * 1001)
-                    break
-
-                time.sleep(1 / 6000 * 1001)
-
-            print(f"\r\033[KScene {scene_rjust(len(probing_second_scenes["scenes"]))}/{scene_rjust(len(probing_second_scenes["scenes"]))} / Second probe complete / {(len(probing_second_scenes["scenes"]) - probing_second_done_scenes_len_start) / (time.time() - probing_second_start):.2f} scenes per second", end="\n", flush=True)
-    else:
-        probing_second_process.wait()
-
-    assert probing_second_output_file.exists()
-
-if metric_has_metric:
-    if metric_method_has_vapoursynth:
-        metric_processed_reference = {}
-        
-        metric_second = zone_default.source_provider(probing_second_output_file)
-        metric_processed_second = {}
-        metric_second_metric_clips = {}
-        
-    if metric_method_has_ffvship:
-        metric_ffvship_second_cache = progression_boost_temp_dir / "metric-ffvship-second.ffindex"
-
-    start = time.time() - 0.000001
-    start_count = -1
-    probing_frame_head = 0
-    for scene_n, zone_scene in enumerate(zone_scenes["scenes"]):
-        if zone_scene["zone"].metric_enable:
-            if "second_score" not in metric_result["scenes"][scene_n]:
-                start_count += 1
-                print(f"\r\033[K{scene_frame_print(scene_n)} / Calculating metric / {start_count / (time.time() - start):.2f} scenes per second", end="", flush=True)
+            start_count += 1
+            print(f"\r\033[K{scene_frame_print(scene_n)} / Calculating metric for {probing_round} probe / {start_count / (time.time() - start):.2f} scenes per second", end="", flush=True)
 
+            if probing_round == "first":
+                if "frames" not in metric_result["scenes"][scene_n]:
+                    metric_result["scenes"][scene_n]["frames"] = metric_select_frames(scene_n, zone_scene, probing_file)
+            else:
                 assert "frames" in metric_result["scenes"][scene_n], "This indicates a bug in the original code. Please report this to the repository including this entire error message."
-    
-                reference_offset = zone_scene["start_frame"] - probing_frame_head
-                if zone_scene["zone"].metric_method == "vapoursynth":
-                    if zone_scene["zone"] not in metric_processed_reference:
-                        metric_processed_reference[zone_scene["zone"]] = zone_scene["zone"].metric_process(zone_scene["zone"].metric_reference)
-                    if zone_scene["zone"] not in metric_processed_second:
-                        metric_processed_second[zone_scene["zone"]] = zone_scene["zone"].metric_process(metric_second)
-    
-                    if (zone_scene["zone"], reference_offset) not in metric_second_metric_clips:
-                        metric_second_metric_clips[(zone_scene["zone"], reference_offset)] = zone_scene["zone"].metric_vapoursynth_calculate(metric_processed_reference[zone_scene["zone"]][reference_offset:], metric_processed_second[zone_scene["zone"]])
-        
-                    clip = metric_second_metric_clips[(zone_scene["zone"], reference_offset)][int(metric_result["scenes"][scene_n]["frames"][0] + probing_frame_head)]
-                    for frame in metric_result["scenes"][scene_n]["frames"][1:]:
-                        clip += metric_second_metric_clips[(zone_scene["zone"], reference_offset)][int(frame + probing_frame_head)]
-        
-                    scores = np.array([zone_scene["zone"].metric_vapoursynth_metric(frame) for frame in clip.frames(backlog=48)])
-                    
-                elif zone_scene["zone"].metric_method == "ffvship":
-                    metric_ffvship_output_file.unlink(missing_ok=True)
-
-                    command = [
-                        "FFVship",
-                        "--source", input_file,
-                        "--encoded", probing_second_output_file,
-                        "--cache-index",
-                        "--source-index", metric_ffvship_source_cache,
-                        "--encoded-index", metric_ffvship_second_cache,
-                        "--metric", zone_scene["zone"].metric_ffvship_calculate
-                    ]
-                    if zone_scene["zone"].metric_ffvship_calculate == "Butteraugli" and zone_scene["zone"].metric_ffvship_intensity_target is not None:
-                        command += ["--intensity-target", str(zone_scene["zone"].metric_ffvship_intensity_target)]
-                    command += [
-                        "--json", metric_ffvship_output_file,
-                        "--source-indices", ",".join([str(frame) for frame in (metric_result["scenes"][scene_n]["frames"] + zone_scene["start_frame"])]),
-                        "--encoded-offset", str(-reference_offset),
-                        *zone_scene["zone"].metric_ffvship_extra_parameters
-                    ]
-                    subprocess.run(command, text=True, stdout=subprocess.DEVNULL)
-                    assert metric_ffvship_output_file.exists()
-
-                    with metric_ffvship_output_file.open("r") as metric_output_f:
-                        scores = json.load(metric_output_f)
-                    scores = np.array([zone_scene["zone"].metric_ffvship_metric(frame) for frame in scores])
-                
-                metric_result["scenes"][scene_n]["second_score"] = zone_scene["zone"].metric_summarise(np.array(metric_result["scenes"][scene_n]["frames"]), scores)
 
-            probing_frame_head += zone_scene["end_frame"] - zone_scene["start_frame"]
+            metric_cache = metric_cache_load(zone_scene, probing_file)
+            missing_frames = [int(frame) for frame in metric_result["scenes"][scene_n]["frames"] if int(frame) not in metric_cache["frames"]]
+            if not missing_frames:
+                if probing_round == "first" and scene_n in metric_kept_frames:
+                    del metric_kept_frames[scene_n]
+                metric_cache_summarise(probing_round, scene_n, metric_cache)
+            elif zone_scene["zone"].metric_method == "ffvship":
+                metric_running[(probing_round, scene_n)] = metric_ffvship_launch(probing_round, scene_n, zone_scene, probing_file, metric_cache, missing_frames)
+            else:
+                metric_vapoursynth_launch(probing_round, scene_n, zone_scene, probing_file, metric_cache, missing_frames)
+            continue
 
-            with metric_result_file.open("w") as metric_result_f:
-                json.dump(metric_result, metric_result_f, cls=NumpyEncoder)
+        print(f"\r\033[KScene {scene_rjust(probing_finished)}/{scene_rjust(len(probing_chunks))} / Waiting for probe encodes / {len(probing_running)} probe encodes running", end="", flush=True)
+        if metric_requests:
+            futures.wait([frame for probing_round, scene_n, i, frame in metric_requests], timeout=1 / 6000 * 1001, return_when=futures.FIRST_COMPLETED)
+        else:
+            time.sleep(1 / 6000 * 1001)
+
+    metric_result_journal.save(metric_result)
 
     if start_count != -1:
-        print(f"\r\033[K{scene_frame_print(scene_n)} / Metric calculation complete / {(start_count + 1) / (time.time() - start):.2f} scenes per second", end="\n", flush=True)
+        print(f"\r\033[KScene {scene_rjust(probing_finished)}/{scene_rjust(len(probing_chunks))} / Probing complete / {(start_count + 1) / (time.time() - start):.2f} scenes per second", end="\n", flush=True)
 
+if metric_has_metric:
     # Failsafe for `--resume` # Fixed it properly this time
     # for scene_n, zone_scene in enumerate(zone_scenes["scenes"]):
     #     if zone_scene["zone"].metric_enable:
@@ -4038,10 +5103,10 @@ for scene_n, zone_scene in enumerate(zone_scenes["scenes"]):
 
     if zone_scene["zone"].character_enable:
         # `character_map` in the front so that it is accessible in `metric_dynamic_crf` and `metric_dynamic_preset`.
-        character_map_file = character_boost_temp_dir / f"character-{scene_rjust(scene_n)}.npy"
-        assert character_map_file.exists(), "This indicates a bug in the original code. Please report this to the repository including this entire error message."
+        character_wait(scene_n)
+        assert "kyara" in character_kyara["scenes"][scene_n], "This indicates a bug in the original code. Please report this to the repository including this entire error message."
 
-        character_map = np.load(character_map_file)
+        character_map = character_store[character_offsets[scene_n]:character_offsets[scene_n + 1]].astype(np.float64)
 
     if zone_scene["zone"].metric_enable:
         assert "first_qstep" in metric_result["scenes"][scene_n], "This indicates a bug in the original code. Please report this to the repository including this entire error message."
@@ -4348,6 +5413,15 @@ for scene_n, zone_scene in enumerate(zone_scenes["scenes"]):
     if zone_scene["zone"].character_enable and zone["zone"].character_roi_boost_max:
         final_scenes["scenes"][scene_n]["zone_overrides"]["video_params"] += ["--roi-map-file", str(roi_map_file)]
     
+if character_has_character:
+    if character_frames:
+        character_worker.join()
+    character_journal.save(character_kyara)
+    if character_calculated != 0:
+        print(f"\r\033[K{scene_frame_print(len(scenes["scenes"]) - 1)} / Character segmentation complete / {character_calculated / (time.time() - character_start):.2f} scenes per second", end="\n", flush=True)
+        if character_propagated_count != 0:
+            print(f"\r\033[K{scene_frame_print(len(scenes["scenes"]) - 1)} / Character segmentation / {character_propagated_count} of {character_propagated_count + len(character_frames)} frames propagated", end="\n", flush=True)
+
 final_scenes["split_scenes"] = final_scenes["scenes"]
 with scenes_file.open("w") as scenes_f:
     json.dump(final_scenes, scenes_f, cls=NumpyEncoder)
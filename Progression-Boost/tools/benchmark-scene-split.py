@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Progression Boost
+# Copyright (c) Akatsumekusa and contributors
+
+# ---------------------------------------------------------------------
+# Benchmark for the diff fusion and scene splitting of the
+# `x264_vapoursynth` scene detection method.
+#
+# The fusion and splitting code is extracted from each
+# `Progression-Boost.py` given on the commandline and run on the same
+# synthetic diffs. The synthetic diffs have gamma distributed noise,
+# scenecuts about every 90 frames, still sections and luma flashes.
+# The split frames of all given files are compared with each other.
+#
+# To compare against an older version, export it first:
+# ```
+# git show <revision>:Progression-Boost/Progression-Boost.py > old.py
+# python benchmark-scene-split.py old.py ../Progression-Boost.py --frames 10000 50000
+# ```
+# The extracted code uses nested quotes in f-strings, which requires
+# Python 3.12 or newer. VapourSynth is not required.
+# ---------------------------------------------------------------------
+
+import argparse
+import math
+import numpy as np
+from numpy.random import default_rng
+from pathlib import Path
+import re
+import textwrap
+import time
+from types import SimpleNamespace
+
+parser = argparse.ArgumentParser(prog="Progression Boost scene split benchmark")
+parser.add_argument("files", type=Path, nargs="+", help="`Progression-Boost.py` files to benchmark")
+parser.add_argument("--frames", type=int, nargs="+", default=[10000, 50000, 100000], help="Number of frames of each synthetic zone (Default: 10000 50000 100000)")
+parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2], help="Seeds for the synthetic diffs (Default: 0 1 2)")
+args = parser.parse_args()
+
+
+def extract(file):
+    lines = file.read_text(encoding="utf-8").replace("\r\n", "\n").split("\n")
+
+    # The fusion starts at `diffs_half` and the splitting function ends
+    # right before it's called for the whole zone.
+    begin = next(i for i, line in enumerate(lines) if line.strip() == "diffs_half = diffs / 2")
+    end = next(i for i in range(begin, len(lines)) if lines[i].strip().startswith("start_frames = scene_detection_split_scene(0,"))
+    code = compile(textwrap.dedent("\n".join(lines[begin:end])), str(file), "exec")
+
+    settings = {}
+    for line in lines:
+        if match := re.match(r"^    (scene_detection_\w+) = (\d+)\s*$", line):
+            settings.setdefault(match.group(1), int(match.group(2)))
+    settings["scene_detection_method"] = "x264_vapoursynth"
+    return code, SimpleNamespace(**settings)
+
+def synthesise(frames, seed):
+    rng = default_rng(seed)
+    diffs = rng.gamma(2.0, 0.002, frames)
+    vapoursynth_scenecut = np.zeros((frames,), dtype=float)
+    x264_scenecut = np.zeros((frames,), dtype=float)
+    luma_scenecut = np.zeros((frames,), dtype=bool)
+
+    frame = 0
+    while frame < frames:
+        length = max(int(rng.normal(90, 40)), 4)
+        kind = rng.random()
+        if kind < 0.10:
+            diffs[frame:frame + length] = rng.gamma(2.0, 0.0002, diffs[frame:frame + length].shape[0])
+        elif kind < 0.15:
+            luma_scenecut[frame:frame + min(length, 6)] = True
+        if frame != 0:
+            diffs[frame] += rng.uniform(0.02, 0.2)
+            if rng.random() < 0.85:
+                vapoursynth_scenecut[frame] = 1.0
+            if rng.random() < 0.8:
+                x264_scenecut[frame] = 1.0
+        frame += length
+    vapoursynth_scenecut[rng.random(frames) < 0.004] = 1.0
+    x264_scenecut[rng.random(frames) < 0.003] = 1.0
+    luma_scenecut[0] = True
+
+    return diffs, luma_scenecut, vapoursynth_scenecut, x264_scenecut
+
+def run(code, settings, frames, seed):
+    diffs, luma_scenecut, vapoursynth_scenecut, x264_scenecut = synthesise(frames, seed)
+    namespace = {
+        "np": np,
+        "math": math,
+        "verbose": 0,
+        "print": lambda *args, **kwargs: None,
+        "frame_scene_print": lambda start_frame, end_frame: "",
+        "zone": {"start_frame": 0, "end_frame": frames, "zone": settings},
+        "diffs": diffs,
+        "luma_scenecut": luma_scenecut,
+        "vapoursynth_scenecut": vapoursynth_scenecut,
+        "x264_scenecut": x264_scenecut
+    }
+
+    start = time.perf_counter()
+    exec(code, namespace)
+    start_frames = namespace["scene_detection_split_scene"](0, frames)
+    return time.perf_counter() - start, [int(frame) for frame in start_frames]
+
+
+extracted = [extract(file) for file in args.files]
+
+print("frames".rjust(10) + "".join(file.name.rjust(24) for file in args.files) + "   split frames")
+for frames in args.frames:
+    times = [[] for file in args.files]
+    identical = True
+    for seed in args.seeds:
+        results = []
+        for i, (code, settings) in enumerate(extracted):
+            elapsed, start_frames = run(code, settings, frames, seed)
+            times[i].append(elapsed)
+            results.append(start_frames)
+        identical = identical and all(result == results[0] for result in results)
+    print(str(frames).rjust(10) +
+          "".join(f"{np.median(file_times):.3f} s".rjust(24) for file_times in times) +
+          f"   {"identical" if identical else "DIFFERENT"} ({len(args.seeds)} seeds)")